@@ -0,0 +1,143 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import hashlib
+import os
+import shutil
+import typing
+
+
+class AssemblyCache:
+    """An on-disk cache of assembler outputs, addressed by content.
+
+    Every entry is stored under a key that hashes the assembler's version,
+    the options that change the output, and the full .asm source, so an
+    entry can never be stale: editing the source, the assembler or the
+    options simply produces a different key. An entry holds one file per
+    output suffix (".hack", and ".bin" when images are written).
+
+    The cache is bounded in size. Entries are touched whenever they are hit,
+    and when the total size goes over the limit the least recently used
+    entries are evicted first.
+    """
+
+    def __init__(self, directory: str, version: str,
+                 max_size: int = 64 * 1024 * 1024) -> None:
+        """Opens (and creates, if needed) a cache directory.
+
+        Args:
+            directory (str): where the entries are stored.
+            version (str): identifies the assembler that produced the entries.
+            max_size (int): the maximal total size of the entries, in bytes.
+        """
+        self._directory = directory
+        self._version = version
+        self._max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source: bytes, options: str) -> str:
+        """Computes the key of an assembly.
+
+        Args:
+            source (bytes): the contents of the .asm file.
+            options (str): the options that affect the output.
+
+        Returns:
+            str: the key, as a hex digest.
+        """
+        digest = hashlib.sha256()
+        for part in (self._version.encode(), options.encode(), source):
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def fetch(self, key: str, outputs: typing.Dict[str, str]) -> bool:
+        """Materializes a cached entry at the given output paths.
+
+        Each output is hard-linked to its stored copy when possible, and
+        copied otherwise. Outputs are replaced atomically.
+
+        Args:
+            key (str): the key of the entry.
+            outputs (typing.Dict[str, str]): output path by suffix.
+
+        Returns:
+            bool: True on a hit, False if the entry is missing.
+        """
+        entries = {suffix: self._entry_path(key, suffix) for suffix in outputs}
+        if not all(os.path.exists(entry) for entry in entries.values()):
+            self.misses += 1
+            return False
+        try:
+            for suffix, path in outputs.items():
+                self._place(entries[suffix], path)
+                os.utime(entries[suffix])
+        except FileNotFoundError:
+            # The entry was evicted by a concurrent process meanwhile.
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key: str, outputs: typing.Dict[str, str]) -> None:
+        """Adds freshly assembled outputs to the cache, then evicts the least
+        recently used entries if the cache grew past its limit.
+
+        Args:
+            key (str): the key of the entry.
+            outputs (typing.Dict[str, str]): output path by suffix.
+        """
+        for suffix, path in outputs.items():
+            entry = self._entry_path(key, suffix)
+            temporary_entry = f"{entry}.{os.getpid()}.tmp"
+            shutil.copyfile(path, temporary_entry)
+            os.replace(temporary_entry, entry)
+        self._evict()
+
+    def _entry_path(self, key: str, suffix: str) -> str:
+        return os.path.join(self._directory, key + suffix)
+
+    @staticmethod
+    def _place(entry: str, path: str) -> None:
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.link(entry, temporary_path)
+        except OSError:
+            shutil.copyfile(entry, temporary_path)
+        os.replace(temporary_path, path)
+
+    def _evict(self) -> None:
+        # An entry is every file sharing a key; it is as recent as its most
+        # recently touched file, and it is evicted as a whole.
+        files: typing.Dict[str, typing.List[str]] = {}
+        sizes: typing.Dict[str, int] = {}
+        last_used: typing.Dict[str, float] = {}
+        with os.scandir(self._directory) as directory_entries:
+            for directory_entry in directory_entries:
+                if directory_entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    status = directory_entry.stat()
+                except FileNotFoundError:
+                    continue
+                key = directory_entry.name.split(".", 1)[0]
+                files.setdefault(key, []).append(directory_entry.path)
+                sizes[key] = sizes.get(key, 0) + status.st_size
+                last_used[key] = max(
+                    last_used.get(key, 0.0), status.st_mtime)
+        total_size = sum(sizes.values())
+        for key in sorted(last_used, key=last_used.get):
+            if total_size <= self._max_size:
+                break
+            for stale_file in files[key]:
+                try:
+                    os.unlink(stale_file)
+                except FileNotFoundError:
+                    pass
+            total_size -= sizes[key]
@@ -0,0 +1,245 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import typing
+from SymbolTable import SymbolTable
+from Parser import Parser
+from Main import first_pass, second_pass, convert_to_binary
+
+
+# The sample programs, relative to this directory.
+CORPUS = ("pong/Pong.asm", "pong/PongL.asm", "rect/Rect.asm",
+          "rect/RectL.asm", "max/Max.asm", "max/MaxL.asm")
+
+# Mixes of synthetic instructions, see synthetic_lines.
+MIXES = ("labels", "variables", "c-instructions")
+
+DEFAULT_SIZES = (10 ** 5, 10 ** 6, 10 ** 7)
+
+# C-instructions of the kind the VM translator emits.
+C_INSTRUCTIONS = ("D=M", "M=D", "AM=M+1", "AM=M-1", "A=A-1", "D=A",
+                  "M=D+M", "D=D-M", "MD=M-1", "A=M", "M=-1", "M=0",
+                  "D;JGT", "D;JEQ", "0;JMP", "D=D+A")
+
+# The assembler passes, in the order assemble_file runs them.
+PASSES = ("parse", "first_pass", "second_pass", "convert_to_binary")
+
+
+def synthetic_lines(mix: str, count: int,
+                    seed: int = 0) -> typing.Iterator[str]:
+    """Generates a deterministic synthetic program.
+
+    Args:
+        mix (str): "labels" declares a label every 4 lines and jumps to
+            labels before and after it, "variables" refers to thousands of
+            distinct variables, and "c-instructions" is almost only
+            C-instructions.
+        count (int): number of lines to generate.
+        seed (int): seed of the generator.
+
+    Returns:
+        typing.Iterator[str]: the lines, with their newlines.
+    """
+    generator = random.Random(seed)
+    if mix == "labels":
+        # Label n is declared at ROM address 3n, so only the labels below
+        # address 32768 are referenced, and every address fits in @value.
+        referenced = max(1, min(count // 4, 32768 // 3))
+        for index in range(count // 4):
+            yield f"(LOOP.{index})\n"
+            yield f"@LOOP.{generator.randrange(referenced)}\n"
+            yield "D;JGT\n"
+            yield generator.choice(C_INSTRUCTIONS) + "\n"
+        return
+    for _ in range(count):
+        choice = generator.random()
+        if mix == "variables" and choice < 0.5:
+            yield f"@var.{generator.randrange(16000)}\n"
+        elif mix == "c-instructions" and choice < 0.9:
+            yield generator.choice(C_INSTRUCTIONS) + "\n"
+        elif choice < 0.6:
+            yield f"@{generator.randrange(32768)}\n"
+        else:
+            yield generator.choice(C_INSTRUCTIONS) + "\n"
+
+
+def time_passes(input_path: str) -> typing.Dict[str, float]:
+    """Runs the passes of assemble_file on one input, timing each one.
+
+    Args:
+        input_path (str): the .asm file.
+
+    Returns:
+        typing.Dict[str, float]: seconds by pass name.
+    """
+    seconds = {}
+    start = time.perf_counter()
+    with open(input_path, 'r') as input_file:
+        parser = Parser(input_file)
+    seconds["parse"] = time.perf_counter() - start
+    symbol_table = SymbolTable()
+    start = time.perf_counter()
+    first_pass(parser, symbol_table)
+    seconds["first_pass"] = time.perf_counter() - start
+    start = time.perf_counter()
+    second_pass(parser, symbol_table)
+    seconds["second_pass"] = time.perf_counter() - start
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as output_file:
+        convert_to_binary(parser, symbol_table, output_file)
+    seconds["convert_to_binary"] = time.perf_counter() - start
+    return seconds
+
+
+def peak_memory(input_path: str) -> int:
+    """Measures the peak memory allocated while assembling one input. This
+    is a separate run, since tracing allocations slows everything down.
+
+    Args:
+        input_path (str): the .asm file.
+
+    Returns:
+        int: the peak, in bytes.
+    """
+    tracemalloc.start()
+    try:
+        time_passes(input_path)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark(name: str, input_path: str, repeat: int,
+              measure_memory: bool) -> typing.Dict[str, typing.Any]:
+    """Benchmarks one input, keeping the fastest of repeat runs.
+
+    Args:
+        name (str): the input's name in the results.
+        input_path (str): the .asm file.
+        repeat (int): number of timed runs.
+        measure_memory (bool): also measure the peak memory.
+
+    Returns:
+        typing.Dict[str, typing.Any]: the result record.
+    """
+    with open(input_path, 'r') as input_file:
+        lines = sum(1 for _ in input_file)
+    runs = [time_passes(input_path) for _ in range(repeat)]
+    best = min(runs, key=lambda run: sum(run.values()))
+    seconds = sum(best.values())
+    return {
+        "input": name,
+        "lines": lines,
+        "seconds": seconds,
+        "lines_per_second": lines / seconds if seconds else None,
+        "peak_memory_bytes": peak_memory(input_path) if measure_memory
+        else None,
+        "passes": best,
+    }
+
+
+def current_commit() -> typing.Optional[str]:
+    """
+    Returns:
+        typing.Optional[str]: the git commit of this directory, if any.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(result: typing.Dict[str, typing.Any],
+           baseline: typing.Optional[typing.Dict[str, typing.Any]]) -> str:
+    """Formats one result record as a line of text.
+
+    Args:
+        result (typing.Dict[str, typing.Any]): the record.
+        baseline (typing.Optional[typing.Dict[str, typing.Any]]): the
+            record of the same input in an earlier run, if any.
+
+    Returns:
+        str: the line.
+    """
+    passes = " ".join(f"{name}={result['passes'][name] * 1000:.1f}ms"
+                      for name in PASSES)
+    line = (f"{result['input']}: {result['lines']} lines, "
+            f"{result['lines_per_second'] or 0:,.0f} lines/s, {passes}")
+    if result["peak_memory_bytes"] is not None:
+        line += f", peak {result['peak_memory_bytes'] / 2 ** 20:.1f} MiB"
+    if baseline is not None and result["seconds"]:
+        line += f", {baseline['seconds'] / result['seconds']:.2f}x baseline"
+    return line
+
+
+if "__main__" == __name__:
+    # Benchmarks the sample programs and synthetic programs of every mix.
+    argument_parser = argparse.ArgumentParser(
+        prog="Benchmark", description="Measures Hack assembler throughput.")
+    argument_parser.add_argument(
+        "--sizes", type=int, nargs="*", default=list(DEFAULT_SIZES),
+        metavar="LINES",
+        help="line counts of the synthetic programs (default: 10^5 10^6 "
+        "10^7)")
+    argument_parser.add_argument(
+        "--mixes", nargs="*", choices=MIXES, default=list(MIXES),
+        help="synthetic mixes to run (default: all)")
+    argument_parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="timed runs per input; the fastest is kept (default: 3)")
+    argument_parser.add_argument(
+        "--no-memory", action="store_true",
+        help="skip the peak memory measurement")
+    argument_parser.add_argument(
+        "--output", metavar="JSON", help="save the results to this file")
+    argument_parser.add_argument(
+        "--compare", metavar="JSON",
+        help="report speedups against the results saved in this file")
+    arguments = argument_parser.parse_args()
+
+    baselines = {}
+    if arguments.compare:
+        with open(arguments.compare, 'r') as baseline_file:
+            baselines = {result["input"]: result
+                         for result in json.load(baseline_file)["results"]}
+    directory = os.path.dirname(os.path.abspath(__file__))
+    results = []
+
+    def run(name: str, input_path: str) -> None:
+        result = benchmark(name, input_path, arguments.repeat,
+                           not arguments.no_memory)
+        results.append(result)
+        print(report(result, baselines.get(name)), flush=True)
+
+    for relative_path in CORPUS:
+        run(relative_path, os.path.join(directory, relative_path))
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        for mix in arguments.mixes:
+            for size in arguments.sizes:
+                input_path = os.path.join(temporary_directory, "input.asm")
+                with open(input_path, 'w') as input_file:
+                    input_file.writelines(synthetic_lines(mix, size))
+                run(f"synthetic/{mix}/{size}", input_path)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump({"commit": current_commit(),
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "results": results}, output_file, indent=2)
@@ -0,0 +1,263 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import (Command, NumberedCommand, A_COMMAND, C_COMMAND,
+                    L_COMMAND)
+
+
+# The jump taken exactly when the given one is not.
+INVERTED_JUMPS = {
+    'JGT': 'JLE', 'JLE': 'JGT',
+    'JEQ': 'JNE', 'JNE': 'JEQ',
+    'JGE': 'JLT', 'JLT': 'JGE'
+}
+
+
+class _Block:
+    """A run of commands that is only entered at its labels and only left
+    at its end, by its final jump or by falling into the next block."""
+
+    __slots__ = ("labels", "body")
+
+    def __init__(self) -> None:
+        self.labels: typing.List[NumberedCommand] = []
+        self.body: typing.List[NumberedCommand] = []
+
+    def ends_unconditionally(self) -> bool:
+        return bool(self.body) and self.body[-1][1].jump == 'JMP'
+
+    def jump_target(self) -> typing.Optional[str]:
+        # The symbol loaded right before the final jump, if there is one.
+        if (len(self.body) >= 2 and self.body[-1][1].jump
+                and self.body[-2][1].command_type == A_COMMAND):
+            return self.body[-2][1].symbol
+        return None
+
+    def has_plain_jump(self) -> bool:
+        # Whether the final jump does nothing but jump, and its condition
+        # does not depend on A, so its target can be changed or dropped.
+        if self.jump_target() is None:
+            return False
+        jump = self.body[-1][1]
+        return (not jump.dest and 'A' not in jump.comp
+                and 'M' not in jump.comp)
+
+    def starts_with_load(self) -> bool:
+        # Code entered by a jump may rely on A holding the label's address.
+        # Entering it some other way is only safe if it overwrites A first.
+        return (bool(self.body)
+                and self.body[0][1].command_type == A_COMMAND)
+
+
+class BlockLayout:
+    """Rewrites the layout of a whole program to execute fewer jumps.
+
+    Like the peephole optimizer, it runs before labels are resolved, and
+    keeps the source line of every command. In order, it:
+
+    - inverts a conditional jump over an unconditional one, so that
+      "@T, D;JNE, @F, 0;JMP, (T)" becomes "@F, D;JEQ, (T)";
+    - threads jumps to a block that only jumps elsewhere;
+    - deletes blocks that cannot be reached, and labels that are never
+      referenced;
+    - moves every chain of blocks that is only entered by jumps right after
+      an unconditional jump to it, which then becomes a fall-through.
+
+    A block is reachable if control falls into it, or if a reachable block
+    refers to one of its labels in any way (return addresses are loaded as
+    data, and reached through an indirect jump). Since the whole program
+    must be known, this pass cannot stream, and since it moves code, jumps
+    to literal ROM addresses are rejected with a ValueError.
+    """
+
+    @staticmethod
+    def optimize(commands: typing.Iterable[Command]) -> typing.List[Command]:
+        """Lays out the given commands.
+
+        Args:
+            commands (typing.Iterable[Command]): the decoded commands.
+
+        Returns:
+            typing.List[Command]: the rewritten commands, in order.
+        """
+        return [command for _, command in BlockLayout.optimize_numbered(
+            enumerate(commands))]
+
+    @staticmethod
+    def optimize_numbered(numbered: typing.Iterable[NumberedCommand]
+                          ) -> typing.List[NumberedCommand]:
+        """Like optimize, but for (line number, command) pairs.
+
+        Args:
+            numbered (typing.Iterable[NumberedCommand]): the decoded
+                commands, with their line numbers.
+
+        Returns:
+            typing.List[NumberedCommand]: the rewritten commands, with their
+            line numbers, in order.
+        """
+        blocks = BlockLayout._split(numbered)
+        BlockLayout._invert_branches(blocks)
+        BlockLayout._thread_jumps(blocks)
+        blocks = BlockLayout._remove_unreachable(blocks)
+        blocks = BlockLayout._lay_out(blocks)
+        result = []
+        for block in blocks:
+            result.extend(block.labels)
+            result.extend(block.body)
+        return result
+
+    @staticmethod
+    def _split(numbered: typing.Iterable[NumberedCommand]
+               ) -> typing.List[_Block]:
+        blocks = [_Block()]
+        for line_number, command in numbered:
+            block = blocks[-1]
+            if command.command_type == L_COMMAND:
+                if block.body:
+                    block = _Block()
+                    blocks.append(block)
+                block.labels.append((line_number, command))
+                continue
+            block.body.append((line_number, command))
+            if command.jump:
+                target = block.jump_target()
+                if target is not None and target.isdigit():
+                    raise ValueError(
+                        f"Line {line_number}: cannot lay out a jump to ROM "
+                        f"address {target}; use a label instead")
+                blocks.append(_Block())
+        if not blocks[-1].labels and not blocks[-1].body:
+            blocks.pop()
+        return blocks
+
+    @staticmethod
+    def _invert_branches(blocks: typing.List[_Block]) -> None:
+        for index in range(len(blocks) - 2):
+            branch, jump, following = blocks[index:index + 3]
+            if not (branch.has_plain_jump()
+                    and branch.body[-1][1].jump in INVERTED_JUMPS
+                    and not jump.labels and len(jump.body) == 2
+                    and jump.has_plain_jump()
+                    and jump.ends_unconditionally()
+                    and following.starts_with_load()
+                    and any(label.symbol == branch.jump_target()
+                            for _, label in following.labels)):
+                continue
+            load_line, _ = branch.body[-2]
+            jump_line, condition = branch.body[-1]
+            branch.body[-2] = (load_line, jump.body[0][1])
+            branch.body[-1] = (jump_line, Command(
+                C_COMMAND, dest=condition.dest, comp=condition.comp,
+                jump=INVERTED_JUMPS[condition.jump]))
+            jump.body = []
+        blocks[:] = [block for block in blocks if block.labels or block.body]
+
+    @staticmethod
+    def _thread_jumps(blocks: typing.List[_Block]) -> None:
+        block_by_label = _block_by_label(blocks)
+
+        def final_target(symbol: str) -> str:
+            seen = {symbol}
+            while symbol in block_by_label:
+                block = block_by_label[symbol]
+                if not (len(block.body) == 2 and block.has_plain_jump()
+                        and block.ends_unconditionally()):
+                    break
+                target = block.jump_target()
+                if target in seen:
+                    break
+                seen.add(target)
+                symbol = target
+            return symbol
+
+        for index, block in enumerate(blocks):
+            target = block.jump_target()
+            if not block.has_plain_jump() or target not in block_by_label:
+                continue
+            if not block.ends_unconditionally():
+                # A is different when the jump is not taken, so the next
+                # block must not read it.
+                if (index + 1 == len(blocks)
+                        or not blocks[index + 1].starts_with_load()):
+                    continue
+            threaded = final_target(target)
+            if threaded != target:
+                load_line, _ = block.body[-2]
+                block.body[-2] = (load_line, Command(
+                    A_COMMAND, symbol=threaded))
+
+    @staticmethod
+    def _remove_unreachable(blocks: typing.List[_Block]
+                            ) -> typing.List[_Block]:
+        index_by_label = {label.symbol: index
+                          for index, block in enumerate(blocks)
+                          for _, label in block.labels}
+        reachable = [False] * len(blocks)
+        referenced: typing.Set[str] = set()
+        stack = [0] if blocks else []
+        while stack:
+            index = stack.pop()
+            if reachable[index]:
+                continue
+            reachable[index] = True
+            block = blocks[index]
+            if not block.ends_unconditionally() and index + 1 < len(blocks):
+                stack.append(index + 1)
+            for _, command in block.body:
+                if (command.command_type == A_COMMAND
+                        and command.symbol in index_by_label):
+                    referenced.add(command.symbol)
+                    stack.append(index_by_label[command.symbol])
+        result = []
+        for index, block in enumerate(blocks):
+            if reachable[index]:
+                block.labels = [(line_number, label)
+                                for line_number, label in block.labels
+                                if label.symbol in referenced]
+                result.append(block)
+        return result
+
+    @staticmethod
+    def _lay_out(blocks: typing.List[_Block]) -> typing.List[_Block]:
+        # A trace is a run of blocks that fall into each other. Traces that
+        # end with an unconditional jump can be placed anywhere; the last
+        # trace may fall off the end of the program, so it stays last.
+        traces: typing.List[typing.List[_Block]] = []
+        for block in blocks:
+            if not traces or traces[-1][-1].ends_unconditionally():
+                traces.append([])
+            traces[-1].append(block)
+        trace_by_label = {label.symbol: index
+                          for index, trace in enumerate(traces)
+                          for _, label in trace[0].labels}
+        movable = [index > 0 and trace[-1].ends_unconditionally()
+                   and trace[0].starts_with_load()
+                   for index, trace in enumerate(traces)]
+        placed = [False] * len(traces)
+        result = []
+        for first in range(len(traces)):
+            current = None if placed[first] else first
+            while current is not None:
+                placed[current] = True
+                result.extend(traces[current])
+                last = traces[current][-1]
+                current = None
+                if last.has_plain_jump() and last.ends_unconditionally():
+                    follower = trace_by_label.get(last.jump_target())
+                    if (follower is not None and movable[follower]
+                            and not placed[follower]):
+                        del last.body[-2:]
+                        current = follower
+        return result
+
+
+def _block_by_label(blocks: typing.List[_Block]
+                    ) -> typing.Dict[str, _Block]:
+    return {label.symbol: block
+            for block in blocks for _, label in block.labels}
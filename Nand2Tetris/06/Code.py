@@ -5,11 +5,91 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import functools
+import itertools
+
+
+# The 10 most significant bits of a C-instruction (including the leading
+# 111, or 101 for shifts, and the a-bit), by comp mnemonic.
+COMP_CODES = {
+    '0':   0b1110101010,
+    '1':   0b1110111111,
+    '-1':  0b1110111010,
+    'D':   0b1110001100,
+    'A':   0b1110110000,
+    '!D':  0b1110001101,
+    '!A':  0b1110110001,
+    '-D':  0b1110001111,
+    '-A':  0b1110110011,
+    'D+1': 0b1110011111,
+    'A+1': 0b1110110111,
+    'D-1': 0b1110001110,
+    'A-1': 0b1110110010,
+    'D+A': 0b1110000010,
+    'D-A': 0b1110010011,
+    'A-D': 0b1110000111,
+    'D&A': 0b1110000000,
+    'D|A': 0b1110010101,
+    'M':   0b1111110000,
+    '!M':  0b1111110001,
+    '-M':  0b1111110011,
+    'M+1': 0b1111110111,
+    'M-1': 0b1111110010,
+    'D+M': 0b1111000010,
+    'D-M': 0b1111010011,
+    'M-D': 0b1111000111,
+    'D&M': 0b1111000000,
+    'D|M': 0b1111010101,
+    'A<<': 0b1010100000,
+    'D<<': 0b1010110000,
+    'M<<': 0b1011100000,
+    'A>>': 0b1010000000,
+    'D>>': 0b1010010000,
+    'M>>': 0b1011000000
+}
+
+# Operand-order variants of commutative operations, by canonical mnemonic.
+COMP_ALIASES = {
+    'A+D': 'D+A',
+    'M+D': 'D+M',
+    'A&D': 'D&A',
+    'M&D': 'D&M',
+    'A|D': 'D|A',
+    'M|D': 'D|M',
+    '1+D': 'D+1',
+    '1+A': 'A+1',
+    '1+M': 'M+1'
+}
+COMP_CODES.update(
+    (alias, COMP_CODES[canonical]) for alias, canonical in COMP_ALIASES.items())
+
+# The 3 dest bits, for every ordering of every subset of A, D and M.
+DEST_CODES = {
+    ''.join(registers): sum(4 >> 'ADM'.index(register)
+                            for register in registers)
+    for count in range(4)
+    for registers in itertools.permutations('ADM', count)
+}
+
+JUMP_CODES = {
+    '':    0b000,
+    'JGT': 0b001,
+    'JEQ': 0b010,
+    'JGE': 0b011,
+    'JLT': 0b100,
+    'JNE': 0b101,
+    'JLE': 0b110,
+    'JMP': 0b111
+}
+
+# Number of distinct C-instruction texts remembered by encode_instruction.
+# Generated code only uses a few dozen, so this is plenty.
+ENCODE_CACHE_SIZE = 1024
 
 
 class Code:
     """Translates Hack assembly language mnemonics into binary codes."""
-    
+
     @staticmethod
     def dest(mnemonic: str) -> str:
         """
@@ -19,12 +99,11 @@ class Code:
         Returns:
             str: 3-bit long binary code of the given mnemonic.
         """
-        d1 = '1' if 'A' in mnemonic else '0'
-        d2 = '1' if 'D' in mnemonic else '0'
-        d3 = '1' if 'M' in mnemonic else '0'
-        if mnemonic == '':
-            return '000'
-        return d1 + d2 + d3
+        code = DEST_CODES.get(mnemonic)
+        if code is None:
+            code = sum(4 >> 'ADM'.index(register)
+                       for register in 'ADM' if register in mnemonic)
+        return format(code, '03b')
 
     @staticmethod
     def comp(mnemonic: str) -> str:
@@ -35,43 +114,8 @@ class Code:
         Returns:
             str: the binary code of the given mnemonic.
         """
-        comp_dict = {
-            '0':   '1110101010',
-            '1':   '1110111111',
-            '-1':  '1110111010',
-            'D':   '1110001100',
-            'A':   '1110110000',
-            '!D':  '1110001101',
-            '!A':  '1110110001',
-            '-D':  '1110001111',
-            '-A':  '1110110011',
-            'D+1': '1110011111',
-            'A+1': '1110110111',
-            'D-1': '1110001110',
-            'A-1': '1110110010',
-            'D+A': '1110000010',
-            'D-A': '1110010011',
-            'A-D': '1110000111',
-            'D&A': '1110000000',
-            'D|A': '1110010101',
-            'M':   '1111110000',
-            '!M':  '1111110001',
-            '-M':  '1111110011',
-            'M+1': '1111110111',
-            'M-1': '1111110010',
-            'D+M': '1111000010',
-            'D-M': '1111010011',
-            'M-D': '1111000111',
-            'D&M': '1111000000',
-            'D|M': '1111010101',
-            'A<<': "1010100000",
-            'D<<': "1010110000",
-            'M<<': "1011100000",
-            'A>>': "1010000000",
-            'D>>': "1010010000",
-            'M>>': "1011000000"
-        }
-        return comp_dict.get(mnemonic, '')
+        code = COMP_CODES.get(mnemonic)
+        return '' if code is None else format(code, '010b')
 
     @staticmethod
     def jump(mnemonic: str) -> str:
@@ -82,14 +126,45 @@ class Code:
         Returns:
             str: 3-bit long binary code of the given mnemonic.
         """
-        jump_dict = {
-            '':    '000',
-            'JGT': '001',
-            'JEQ': '010',
-            'JGE': '011',
-            'JLT': '100',
-            'JNE': '101',
-            'JLE': '110',
-            'JMP': '111'
-        }
-        return jump_dict.get(mnemonic, '')
\ No newline at end of file
+        code = JUMP_CODES.get(mnemonic)
+        return '' if code is None else format(code, '03b')
+
+    @staticmethod
+    def encode(dest: str, comp: str, jump: str) -> int:
+        """Encodes a whole C-instruction from its fields.
+
+        Args:
+            dest (str): the dest mnemonic, possibly empty.
+            comp (str): the comp mnemonic.
+            jump (str): the jump mnemonic, possibly empty.
+
+        Returns:
+            int: the 16-bit machine word.
+        """
+        try:
+            return (COMP_CODES[comp] << 6 | DEST_CODES[dest] << 3
+                    | JUMP_CODES[jump])
+        except KeyError:
+            raise ValueError(
+                f"Invalid C-instruction: dest={dest!r} comp={comp!r} "
+                f"jump={jump!r}") from None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=ENCODE_CACHE_SIZE)
+    def encode_instruction(instruction: str) -> int:
+        """Encodes a whole C-instruction from its text, such as "AM=M-1" or
+        "D;JGT". Results are memoized, so a repeated instruction is only
+        decoded once.
+
+        Args:
+            instruction (str): a C-instruction, without whitespace or
+                comments.
+
+        Returns:
+            int: the 16-bit machine word.
+        """
+        dest, equals, comp = instruction.partition('=')
+        if not equals:
+            dest, comp = '', instruction
+        comp, _, jump = comp.partition(';')
+        return Code.encode(dest, comp, jump)
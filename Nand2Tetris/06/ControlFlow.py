@@ -0,0 +1,402 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import typing
+from Parser import Parser, Command, A_COMMAND, L_COMMAND
+from SymbolTable import SymbolTable
+
+
+class BasicBlock:
+    """A maximal run of instructions that is only entered at its start and
+    only left at its end.
+
+    The instructions of a block are the ROM addresses start to end - 1. A
+    block whose final jump goes to an address computed at runtime, such as
+    the return of a VM function, is indirect: its targets are unknown.
+    """
+
+    __slots__ = ("index", "start", "end", "labels", "successors",
+                 "predecessors", "indirect")
+
+    def __init__(self, index: int, start: int,
+                 labels: typing.List[str]) -> None:
+        self.index = index
+        self.start = start
+        self.end = start
+        self.labels = labels
+        self.successors: typing.List[int] = []
+        self.predecessors: typing.List[int] = []
+        self.indirect = False
+
+    @property
+    def size(self) -> int:
+        """
+        Returns:
+            int: the number of instructions in the block.
+        """
+        return self.end - self.start
+
+    @property
+    def name(self) -> str:
+        """
+        Returns:
+            str: the last label declared at the block, or its ROM address.
+        """
+        return self.labels[-1] if self.labels else f"ROM[{self.start}]"
+
+
+class Loop:
+    """A natural loop: a header block that dominates the whole body, and
+    the back edges that return to it."""
+
+    __slots__ = ("header", "blocks", "latches", "depth", "size",
+                 "min_iteration", "max_iteration")
+
+    def __init__(self, header: int, blocks: typing.List[int],
+                 latches: typing.List[int]) -> None:
+        self.header = header
+        self.blocks = blocks
+        self.latches = latches
+        self.depth = 1
+        self.size = 0
+        self.min_iteration = 0
+        self.max_iteration = 0
+
+
+class ControlFlowGraph:
+    """The control-flow graph of a parsed Hack program, and its loops.
+
+    Blocks are split at labels, at literal jump targets and after jumps. A
+    jump's target is the label (or ROM address) loaded into A last in its
+    block. A block that also loads a label as data, like the return address
+    pushed by a VM call, gets an edge to that label too, so that a call is
+    treated as returning to its call site. A number is never taken for a
+    return address, so in symbol-less programs calls do not return, and
+    loops that contain calls are not found.
+
+    Building the graph is linear in the number of commands. Dominators are
+    computed with the iterative algorithm of Cooper, Harvey and Kennedy,
+    which converges in a couple of passes on structured code, and the loop
+    bodies cost their total size, which is linear up to the nesting depth.
+    """
+
+    def __init__(self, commands: typing.Sequence[Command]) -> None:
+        """Builds the graph.
+
+        Args:
+            commands (typing.Sequence[Command]): the decoded commands, as
+                returned by Parser.commands().
+        """
+        self.blocks: typing.List[BasicBlock] = []
+        self._build_blocks(commands)
+        self._loops: typing.Optional[typing.List[Loop]] = None
+
+    def _build_blocks(self, commands: typing.Sequence[Command]) -> None:
+        predefined = SymbolTable()
+        leaders = self._literal_jump_targets(commands)
+        block_by_label: typing.Dict[str, int] = {}
+        # (block, symbol) pairs, resolved once every label is known.
+        jumps: typing.List[typing.Tuple[int, str]] = []
+        returns: typing.List[typing.Tuple[int, str]] = []
+        falls_through: typing.List[bool] = []
+        labels: typing.List[str] = []
+        block = None
+        loaded = None
+        address = 0
+        for command in commands:
+            if command.command_type == L_COMMAND:
+                if block is not None:
+                    falls_through.append(True)
+                    block = None
+                labels.append(command.symbol)
+                continue
+            if block is not None and address in leaders:
+                falls_through.append(True)
+                block = None
+            if block is None:
+                block = BasicBlock(len(self.blocks), address, labels)
+                for label in labels:
+                    block_by_label[label] = block.index
+                self.blocks.append(block)
+                labels = []
+                loaded = None
+            address += 1
+            block.end = address
+            if command.command_type == A_COMMAND:
+                if _is_label(loaded, predefined):
+                    returns.append((block.index, loaded))
+                loaded = command.symbol
+            elif command.jump:
+                if loaded is None or predefined.contains(loaded):
+                    block.indirect = True
+                else:
+                    jumps.append((block.index, loaded))
+                    loaded = None
+                falls_through.append(command.jump != 'JMP')
+                block = None
+            elif 'A' in command.dest:
+                if _is_label(loaded, predefined):
+                    returns.append((block.index, loaded))
+                loaded = None
+        if block is not None:
+            falls_through.append(False)
+        if labels:
+            # Labels at the very end still name a (empty) block.
+            block = BasicBlock(len(self.blocks), address, labels)
+            for label in labels:
+                block_by_label[label] = block.index
+            self.blocks.append(block)
+            falls_through.append(False)
+
+        block_by_address = {block.start: block.index for block in self.blocks
+                            if block.size}
+        for index, symbol in jumps:
+            if symbol.isdigit():
+                target = block_by_address.get(int(symbol))
+            else:
+                target = block_by_label.get(symbol)
+            if target is None:
+                self.blocks[index].indirect = True
+            else:
+                self._add_edge(index, target)
+        for index, symbol in returns:
+            # Only declared labels are return addresses; other symbols are
+            # variables, which say nothing about where the block goes.
+            target = block_by_label.get(symbol)
+            if target is not None:
+                self._add_edge(index, target)
+        for index, falls in enumerate(falls_through):
+            if falls and index + 1 < len(self.blocks):
+                self._add_edge(index, index + 1)
+
+    @staticmethod
+    def _literal_jump_targets(commands: typing.Sequence[Command]
+                              ) -> typing.Set[int]:
+        # Symbol-less programs jump to numbers, which must start blocks too.
+        targets = set()
+        loaded = None
+        for command in commands:
+            if command.command_type == A_COMMAND:
+                loaded = command.symbol
+            elif command.command_type != L_COMMAND:
+                if command.jump and loaded is not None and loaded.isdigit():
+                    targets.add(int(loaded))
+                if 'A' in command.dest:
+                    loaded = None
+        return targets
+
+    def _add_edge(self, source: int, target: int) -> None:
+        if target not in self.blocks[source].successors:
+            self.blocks[source].successors.append(target)
+            self.blocks[target].predecessors.append(source)
+
+    def loops(self) -> typing.List[Loop]:
+        """Finds the natural loops of the program. Irreducible cycles,
+        which have no single dominating header, are not reported.
+
+        Returns:
+            typing.List[Loop]: the loops, outermost first.
+        """
+        if self._loops is None:
+            self._loops = self._find_loops()
+        return self._loops
+
+    def _find_loops(self) -> typing.List[Loop]:
+        blocks = self.blocks
+        if not blocks:
+            return []
+        # A virtual root enters the first block and every block that has no
+        # predecessor, like functions that are never called.
+        root = len(blocks)
+        roots = [0] + [block.index for block in blocks[1:]
+                       if not block.predecessors]
+        order = self._reverse_postorder(root, roots)
+        rpo_number = [-1] * (root + 1)
+        for number, index in enumerate(order):
+            rpo_number[index] = number
+        idom = self._dominators(root, roots, order, rpo_number)
+        dominated = self._dominance_intervals(root, idom)
+
+        def dominates(a: int, b: int) -> bool:
+            return dominated[a][0] <= dominated[b][0] <= dominated[a][1]
+
+        latches: typing.Dict[int, typing.List[int]] = {}
+        for index in order[1:]:
+            for successor in blocks[index].successors:
+                if dominates(successor, index):
+                    latches.setdefault(successor, []).append(index)
+
+        loops = []
+        for header, header_latches in latches.items():
+            body = {header}
+            stack = [latch for latch in header_latches if latch != header]
+            body.update(stack)
+            while stack:
+                for predecessor in blocks[stack.pop()].predecessors:
+                    if predecessor not in body and rpo_number[predecessor] >= 0:
+                        body.add(predecessor)
+                        stack.append(predecessor)
+            loop = Loop(header, sorted(body, key=rpo_number.__getitem__),
+                        header_latches)
+            loop.size = sum(blocks[index].size for index in body)
+            self._measure_iteration(loop, dominates)
+            loops.append(loop)
+
+        # Largest first, so the owner of a header, just before its own loop
+        # claims it, is the innermost loop around it.
+        loops.sort(key=lambda loop: -len(loop.blocks))
+        owner: typing.Dict[int, Loop] = {}
+        for loop in loops:
+            parent = owner.get(loop.header)
+            if parent is not None:
+                loop.depth = parent.depth + 1
+            for index in loop.blocks:
+                owner[index] = loop
+        return loops
+
+    def _reverse_postorder(self, root: int,
+                           roots: typing.List[int]) -> typing.List[int]:
+        visited = [False] * (root + 1)
+        visited[root] = True
+        postorder = []
+        stack = [(root, iter(roots))]
+        while stack:
+            index, successors = stack[-1]
+            for successor in successors:
+                if not visited[successor]:
+                    visited[successor] = True
+                    stack.append(
+                        (successor, iter(self.blocks[successor].successors)))
+                    break
+            else:
+                postorder.append(index)
+                stack.pop()
+        postorder.reverse()
+        return postorder
+
+    def _dominators(self, root: int, roots: typing.List[int],
+                    order: typing.List[int],
+                    rpo_number: typing.List[int]) -> typing.List[int]:
+        idom = [-1] * (root + 1)
+        idom[root] = root
+        root_set = set(roots)
+
+        def intersect(a: int, b: int) -> int:
+            while a != b:
+                while rpo_number[a] > rpo_number[b]:
+                    a = idom[a]
+                while rpo_number[b] > rpo_number[a]:
+                    b = idom[b]
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for index in order[1:]:
+                predecessors = self.blocks[index].predecessors
+                if index in root_set:
+                    predecessors = predecessors + [root]
+                new_idom = -1
+                for predecessor in predecessors:
+                    if idom[predecessor] != -1:
+                        new_idom = (predecessor if new_idom == -1
+                                    else intersect(predecessor, new_idom))
+                if idom[index] != new_idom:
+                    idom[index] = new_idom
+                    changed = True
+        return idom
+
+    @staticmethod
+    def _dominance_intervals(root: int, idom: typing.List[int]
+                             ) -> typing.List[typing.Tuple[int, int]]:
+        # Numbers the dominator tree in preorder; a dominates b exactly when
+        # b's number falls in a's subtree interval.
+        children: typing.List[typing.List[int]] = [[] for _ in idom]
+        for index, parent in enumerate(idom):
+            if parent != -1 and index != root:
+                children[parent].append(index)
+        intervals = [(-1, -2)] * len(idom)
+        counter = 0
+        stack = [(root, False)]
+        first = [0] * len(idom)
+        while stack:
+            index, done = stack.pop()
+            if done:
+                intervals[index] = (first[index], counter - 1)
+                continue
+            first[index] = counter
+            counter += 1
+            stack.append((index, True))
+            stack.extend((child, False) for child in children[index])
+        return intervals
+
+    def _measure_iteration(self, loop: Loop,
+                           dominates: typing.Callable[[int, int], bool]
+                           ) -> None:
+        # Shortest and longest path from the header around to a latch, over
+        # the body without back edges, so an inner loop counts once.
+        blocks = self.blocks
+        body = set(loop.blocks)
+        shortest = {loop.header: blocks[loop.header].size}
+        longest = dict(shortest)
+        for index in loop.blocks:
+            if index not in shortest:
+                continue
+            for successor in blocks[index].successors:
+                if successor in body and not dominates(successor, index):
+                    size = blocks[successor].size
+                    if (successor not in shortest
+                            or shortest[index] + size < shortest[successor]):
+                        shortest[successor] = shortest[index] + size
+                    if (successor not in longest
+                            or longest[index] + size > longest[successor]):
+                        longest[successor] = longest[index] + size
+        reached = [latch for latch in loop.latches if latch in shortest]
+        loop.min_iteration = min((shortest[latch] for latch in reached),
+                                 default=0)
+        loop.max_iteration = max((longest[latch] for latch in reached),
+                                 default=0)
+
+    def report(self) -> str:
+        """Describes every loop, innermost and most expensive first.
+
+        Returns:
+            str: one line per loop.
+        """
+        loops = sorted(self.loops(),
+                       key=lambda loop: (-loop.depth, -loop.max_iteration))
+        lines = []
+        for loop in loops:
+            header = self.blocks[loop.header]
+            iteration = (f"{loop.min_iteration}" if loop.min_iteration
+                         == loop.max_iteration else
+                         f"{loop.min_iteration}-{loop.max_iteration}")
+            lines.append(
+                f"{header.name} (ROM {header.start}): depth {loop.depth}, "
+                f"{len(loop.blocks)} blocks, {loop.size} instructions, "
+                f"{iteration} instructions per iteration")
+        return '\n'.join(lines)
+
+
+def _is_label(symbol: typing.Optional[str], predefined: SymbolTable) -> bool:
+    # Numbers and predefined symbols are data; anything else may be a label.
+    return (symbol is not None and not symbol.isdigit()
+            and not predefined.contains(symbol))
+
+
+if "__main__" == __name__:
+    # Prints the loop report of an .asm file.
+    argument_parser = argparse.ArgumentParser(
+        prog="ControlFlow",
+        description="Reports the loops of a Hack .asm program.")
+    argument_parser.add_argument("input_path", help="an .asm file")
+    arguments = argument_parser.parse_args()
+    with open(arguments.input_path, 'r') as input_file:
+        graph = ControlFlowGraph(Parser(input_file).commands())
+    print(f"{len(graph.blocks)} blocks, {len(graph.loops())} loops")
+    print(graph.report())
@@ -0,0 +1,182 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import array
+import os
+import sys
+import typing
+from SymbolTable import SymbolTable
+from RomImage import RomImage
+
+
+# First line of every object file, followed by the format version.
+OBJECT_MAGIC = "HOBJ"
+OBJECT_VERSION = 1
+
+
+class ObjectFile:
+    """A separately assembled module, before its addresses are final.
+
+    The words are encoded as if the module were loaded at ROM address 0.
+    Every label the module declares is exported, with its module-relative
+    address. A word that refers to one of these labels is listed as a
+    relocation, and the linker adds the module's load address to it. A word
+    that refers to any other symbol is left as 0 and listed as a reference:
+    the symbol is either a label of another module or a variable.
+
+    An object file (.hobj) is text. After a "HOBJ <version>" line come four
+    sections, each a "<NAME> <count>" header followed by its rows: WORDS,
+    one 4-digit hex word per row; LABELS and REFERENCES, one
+    "<address> <symbol>" row each; and RELOCATIONS, one address per row.
+    """
+
+    def __init__(self, words: typing.Sequence[int],
+                 labels: typing.Dict[str, int],
+                 references: typing.List[typing.Tuple[int, str]],
+                 relocations: typing.Sequence[int]) -> None:
+        """Creates an object from its parts.
+
+        Args:
+            words (typing.Sequence[int]): the encoded 16-bit words.
+            labels (typing.Dict[str, int]): module-relative address by label.
+            references (typing.List[typing.Tuple[int, str]]): (word address,
+                symbol) of every unresolved reference, in address order.
+            relocations (typing.Sequence[int]): addresses of the words that
+                hold module-relative label addresses.
+        """
+        self.words = array.array('H', words)
+        self.labels = labels
+        self.references = references
+        self.relocations = array.array('I', relocations)
+
+    def write(self, object_file: typing.TextIO) -> None:
+        """Writes the object in the .hobj format.
+
+        Args:
+            object_file (typing.TextIO): a file opened for text writing.
+        """
+        rows = [f"{OBJECT_MAGIC} {OBJECT_VERSION}\n",
+                f"WORDS {len(self.words)}\n"]
+        rows.extend(format(word, '04x') + '\n' for word in self.words)
+        rows.append(f"LABELS {len(self.labels)}\n")
+        rows.extend(f"{address} {symbol}\n"
+                    for symbol, address in self.labels.items())
+        rows.append(f"REFERENCES {len(self.references)}\n")
+        rows.extend(f"{address} {symbol}\n"
+                    for address, symbol in self.references)
+        rows.append(f"RELOCATIONS {len(self.relocations)}\n")
+        rows.extend(f"{address}\n" for address in self.relocations)
+        object_file.write(''.join(rows))
+
+    @staticmethod
+    def load(object_file: typing.TextIO) -> "ObjectFile":
+        """Reads an object written by write.
+
+        Args:
+            object_file (typing.TextIO): a file opened for text reading.
+
+        Returns:
+            ObjectFile: the object.
+        """
+        lines = iter(object_file.read().splitlines())
+        if next(lines, "") != f"{OBJECT_MAGIC} {OBJECT_VERSION}":
+            raise ValueError("Not a version "
+                             f"{OBJECT_VERSION} Hack object file")
+
+        def section(name: str) -> typing.List[str]:
+            header, count = next(lines).split(' ')
+            if header != name:
+                raise ValueError(f"Expected a {name} section, got {header}")
+            return [next(lines) for _ in range(int(count))]
+
+        words = [int(row, 16) for row in section("WORDS")]
+        labels = {}
+        for row in section("LABELS"):
+            address, symbol = row.split(' ')
+            labels[symbol] = int(address)
+        references = []
+        for row in section("REFERENCES"):
+            address, symbol = row.split(' ')
+            references.append((int(address), symbol))
+        relocations = [int(row) for row in section("RELOCATIONS")]
+        return ObjectFile(words, labels, references, relocations)
+
+
+class Linker:
+    """Combines object files into a single program."""
+
+    @staticmethod
+    def link(objects: typing.Sequence[ObjectFile]) -> array.array:
+        """Links objects, loading them one after the other in the given
+        order. The result is exactly what assembling the concatenation of
+        their sources would give: labels are global, and variables are
+        allocated from address 16 in order of first reference.
+
+        Args:
+            objects (typing.Sequence[ObjectFile]): the objects to link.
+
+        Returns:
+            array.array: the encoded 16-bit words, as an array('H').
+        """
+        symbol_table = SymbolTable()
+        bases = []
+        base = 0
+        labels: typing.Set[str] = set()
+        for module in objects:
+            bases.append(base)
+            for symbol, address in module.labels.items():
+                if symbol in labels:
+                    raise ValueError(f"Label {symbol} is declared twice")
+                labels.add(symbol)
+                symbol_table.add_entry(symbol, base + address)
+            base += len(module.words)
+
+        words = array.array('H')
+        for module, base in zip(objects, bases):
+            module_words = array.array('H', module.words)
+            for address in module.relocations:
+                module_words[address] += base
+            for address, symbol in module.references:
+                if not symbol_table.contains(symbol):
+                    symbol_table.add_entry(
+                        symbol, symbol_table.get_next_available_address())
+                    symbol_table.increment_next_available_address()
+                module_words[address] = symbol_table.get_address(symbol)
+            words.extend(module_words)
+        return words
+
+
+if "__main__" == __name__:
+    # Links the given objects into a .hack or a .bin, depending on the
+    # output's extension.
+    argument_parser = argparse.ArgumentParser(
+        prog="Linker", description="Links Hack .hobj object files.")
+    argument_parser.add_argument(
+        "output_path", help="the .hack or .bin file to write")
+    argument_parser.add_argument(
+        "object_paths", nargs="+", metavar="object_path",
+        help="the .hobj files to link, in load order")
+    argument_parser.add_argument(
+        "--byteorder", choices=("little", "big"), default="little",
+        help="byte order of the words in a .bin image (default: little)")
+    arguments = argument_parser.parse_args()
+    objects = []
+    for object_path in arguments.object_paths:
+        with open(object_path, 'r') as object_file:
+            objects.append(ObjectFile.load(object_file))
+    extension = os.path.splitext(arguments.output_path)[1].lower()
+    if extension not in (".hack", ".bin"):
+        sys.exit("Invalid usage, the output must be a .hack or .bin file")
+    words = Linker.link(objects)
+    if extension == ".hack":
+        with open(arguments.output_path, 'w') as hack_file:
+            hack_file.write(''.join(format(word, '016b') + '\n'
+                                    for word in words))
+    else:
+        with open(arguments.output_path, 'wb') as image_file:
+            RomImage.write(words, image_file, arguments.byteorder)
@@ -5,14 +5,33 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import argparse
+import array
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import io
+import itertools
 import os
 import sys
+import time
 import typing
 from SymbolTable import SymbolTable
-from Parser import Parser
+from Parser import (Parser, Command, NumberedCommand, A_COMMAND, C_COMMAND,
+                    L_COMMAND)
 from Code import Code
+from RomImage import RomImage
+from AssemblyCache import AssemblyCache
+from PeepholeOptimizer import PeepholeOptimizer
+from BlockLayout import BlockLayout
+from SymbolMap import SymbolMap
+from Linker import ObjectFile
 
 
+# Number of words formatted per write when emitting .hack text.
+WRITE_BATCH_SIZE = 4096
+
 def assemble_file(
     input_file: typing.TextIO, output_file: typing.TextIO) -> None:
     """Assembles a single file.
@@ -26,56 +45,407 @@ def assemble_file(
     parser = Parser(input_file)
     symbol_table = SymbolTable()
     first_pass(parser, symbol_table)
-    parser.reset()
     second_pass(parser, symbol_table)
-    parser.reset()
     convert_to_binary(parser, symbol_table, output_file)
 
     # Note that you can write to output_file like so:
     # output_file.write("Hello world! \n")
 
+def assemble_words(input_file: typing.TextIO, optimize: bool = False,
+                   symbol_map: typing.Optional[SymbolMap] = None,
+                   layout: bool = False) -> array.array:
+    """Assembles a single file with the three passes of assemble_file, but
+    returns the machine words instead of writing them as text.
+
+    Args:
+        input_file (typing.TextIO): the file to assemble.
+        optimize (bool): run the peephole optimizer before resolving labels.
+        symbol_map (typing.Optional[SymbolMap]): if given, records the
+            source line and label of every ROM address, and every variable.
+        layout (bool): rearrange the program's blocks to save jumps.
+
+    Returns:
+        array.array: the encoded 16-bit words, as an array('H').
+    """
+    return assemble(input_file, optimize, symbol_map, layout)[0]
+
+def assemble(source: typing.Union[str, typing.Iterable[str]],
+             optimize: bool = False,
+             symbol_map: typing.Optional[SymbolMap] = None,
+             layout: bool = False) -> typing.Tuple[array.array, SymbolTable]:
+    """Assembles a program held in memory, without any file I/O. This is
+    the entry point for tools that call the assembler as a library.
+
+    Args:
+        source (typing.Union[str, typing.Iterable[str]]): the assembly
+            source, either as one string or as an iterable of lines (with
+            or without their newlines), such as a list or an open file.
+        optimize (bool): run the peephole optimizer before resolving labels.
+        symbol_map (typing.Optional[SymbolMap]): if given, records the
+            source line and label of every ROM address, and every variable.
+        layout (bool): rearrange the program's blocks to save jumps.
+
+    Returns:
+        typing.Tuple[array.array, SymbolTable]: the encoded 16-bit words, as
+        an array('H'), and the symbol table with every label and variable.
+    """
+    if isinstance(source, str):
+        source = source.splitlines()
+    parser = Parser(source)
+    if optimize or layout:
+        optimize_commands(parser, optimize, layout)
+    symbol_table = SymbolTable()
+    first_pass(parser, symbol_table)
+    variables = second_pass(parser, symbol_table)
+    if symbol_map is not None:
+        record_symbol_map(parser, symbol_table, variables, symbol_map)
+    return encode_commands(parser, symbol_table), symbol_table
+
+def assemble_object(input_file: typing.TextIO,
+                    optimize: bool = False) -> ObjectFile:
+    """Assembles a single file into a relocatable object, to be linked with
+    other objects later. Labels of the file are resolved relative to its
+    start, and every other symbol that is not predefined is left for the
+    linker, which decides whether it is a label or a variable.
+
+    Args:
+        input_file (typing.TextIO): the file to assemble.
+        optimize (bool): run the peephole optimizer before resolving labels.
+
+    Returns:
+        ObjectFile: the object.
+    """
+    parser = Parser(input_file)
+    if optimize:
+        optimize_commands(parser)
+    symbol_table = SymbolTable()
+    first_pass(parser, symbol_table)
+    labels = {command.symbol: symbol_table.get_address(command.symbol)
+              for command in parser.commands()
+              if command.command_type == L_COMMAND}
+    words = array.array('H')
+    references = []
+    relocations = []
+    encoded_commands: typing.Dict[Command, int] = {}
+    for command in parser.commands():
+        if command.command_type == A_COMMAND:
+            symbol = command.symbol
+            if symbol.isdigit():
+                words.append(int(symbol))
+                continue
+            if symbol in labels:
+                relocations.append(len(words))
+            elif not symbol_table.contains(symbol):
+                references.append((len(words), symbol))
+                words.append(0)
+                continue
+            words.append(symbol_table.get_address(symbol))
+        elif command.command_type == C_COMMAND:
+            word = encoded_commands.get(command)
+            if word is None:
+                word = encode_c_command(command)
+                encoded_commands[command] = word
+            words.append(word)
+    return ObjectFile(words, labels, references, relocations)
+
+def optimize_commands(parser: Parser, peephole: bool = True,
+                      layout: bool = False) -> None:
+    """Replaces the commands of a parser with their optimized rewrite,
+    keeping the source line of every command.
+
+    Args:
+        parser (Parser): the parsed program.
+        peephole (bool): run the peephole optimizer.
+        layout (bool): then run the block layout pass over the whole
+            program.
+    """
+    numbered: typing.Iterable[NumberedCommand] = zip(
+        parser.line_numbers(), parser.commands())
+    if peephole:
+        numbered = PeepholeOptimizer.optimize_numbered(numbered)
+    if layout:
+        numbered = BlockLayout.optimize_numbered(numbered)
+    numbered = list(numbered)
+    parser.set_commands([command for _, command in numbered],
+                        [line_number for line_number, _ in numbered])
+
+def assemble_file_single_pass(
+    input_file: typing.TextIO, output_file: typing.TextIO) -> None:
+    """Assembles a single file in one pass over its commands. See
+    assemble_words_single_pass.
+
+    Args:
+        input_file (typing.TextIO): the file to assemble.
+        output_file (typing.TextIO): writes all output to this file.
+    """
+    write_words(assemble_words_single_pass(input_file), output_file)
+
+def assemble_words_single_pass(
+        input_file: typing.TextIO, optimize: bool = False,
+        symbol_map: typing.Optional[SymbolMap] = None) -> array.array:
+    """Assembles a single file in one pass over its commands.
+
+    Every instruction is encoded as soon as it is read. An A-instruction that
+    refers to a symbol which is not known yet is emitted as a placeholder and
+    recorded in a fixup table, and is patched as soon as the matching (LABEL)
+    declaration is seen. Symbols that are still unresolved at the end of the
+    input are variables, and they are allocated in order of first reference,
+    just like second_pass does, so the output is identical to assemble_file.
+
+    The input is streamed rather than read whole, and only the symbol table,
+    the fixup table and a packed buffer of 16-bit words are kept in memory, so
+    this mode also suits very large programs and pipes. The peephole
+    optimizer works one basic block at a time, so it keeps this property.
+
+    Args:
+        input_file (typing.TextIO): the file to assemble.
+        optimize (bool): run the peephole optimizer before resolving labels.
+        symbol_map (typing.Optional[SymbolMap]): if given, records the
+            source line and label of every ROM address, and every variable.
+
+    Returns:
+        array.array: the encoded 16-bit words, as an array('H').
+    """
+    symbol_table = SymbolTable()
+    words = array.array('H')
+    fixups: typing.Dict[str, typing.List[int]] = {}
+    encoded_commands: typing.Dict[Command, int] = {}
+    commands = Parser.stream_numbered(input_file)
+    if optimize:
+        commands = PeepholeOptimizer.optimize_numbered(commands)
+    for line_number, command in commands:
+        command_type = command.command_type
+        if symbol_map is not None:
+            if command_type == L_COMMAND:
+                symbol_map.add_label(command.symbol)
+            else:
+                symbol_map.add_instruction(line_number)
+        if command_type == A_COMMAND:
+            symbol = command.symbol
+            if symbol.isdigit():
+                words.append(int(symbol))
+            elif symbol_table.contains(symbol):
+                words.append(symbol_table.get_address(symbol))
+            else:
+                fixups.setdefault(symbol, []).append(len(words))
+                words.append(0)
+        elif command_type == L_COMMAND:
+            symbol_table.add_entry(command.symbol, len(words))
+            for address in fixups.pop(command.symbol, ()):
+                words[address] = len(words)
+        else:
+            word = encoded_commands.get(command)
+            if word is None:
+                word = encode_c_command(command)
+                encoded_commands[command] = word
+            words.append(word)
+
+    # Whatever is left in the fixup table was never declared as a label.
+    for symbol, addresses in fixups.items():
+        address = symbol_table.get_next_available_address()
+        symbol_table.add_entry(symbol, address)
+        symbol_table.increment_next_available_address()
+        if symbol_map is not None:
+            symbol_map.add_variable(symbol, address)
+        for rom_address in addresses:
+            words[rom_address] = address
+    return words
+
+def encode_c_command(command: Command) -> int:
+    """Encodes a decoded C-command into its 16-bit machine word.
+
+    Args:
+        command (Command): a C-command.
+
+    Returns:
+        int: the machine word.
+    """
+    return Code.encode(command.dest, command.comp, command.jump)
+
+def write_words(words: typing.Sequence[int], output_file: typing.TextIO) -> None:
+    """Writes encoded machine words as .hack text, one binary line per word.
+
+    Args:
+        words (typing.Sequence[int]): the encoded 16-bit words.
+        output_file (typing.TextIO): writes all output to this file.
+    """
+    for start in range(0, len(words), WRITE_BATCH_SIZE):
+        output_file.write(''.join(
+            format(word, '016b') + '\n'
+            for word in words[start:start + WRITE_BATCH_SIZE]))
+
+def assemble_path(input_path: str, options: argparse.Namespace
+                  ) -> typing.Tuple[float, typing.Optional[bool]]:
+    """Assembles one .asm file into a .hack file next to it (and a .bin
+    image, if options.bin is set), or into a .hobj object file if
+    options.object is set. Every output replaces its previous
+    version atomically, so a reader never sees a partially written file.
+    This is also the unit of work of the --jobs process pool.
+
+    If options.cache names a cache directory, the outputs are taken from
+    the cache when the same source was already assembled with the same
+    assembler and output options, and are stored there otherwise.
+
+    Args:
+        input_path (str): path of the .asm file.
+        options (argparse.Namespace): the parsed command line options.
+
+    Returns:
+        typing.Tuple[float, typing.Optional[bool]]: the time it took, in
+        seconds, and whether it was a cache hit (None without a cache).
+    """
+    start = time.perf_counter()
+    filename = os.path.splitext(input_path)[0]
+    if options.object:
+        outputs = {".hobj": filename + ".hobj"}
+    else:
+        outputs = {".hack": filename + ".hack"}
+    if options.bin:
+        outputs[".bin"] = filename + ".bin"
+    if options.map:
+        outputs[".map"] = filename + ".map"
+    cache = None
+    if options.cache:
+        cache = AssemblyCache(options.cache, assembler_version(),
+                              options.cache_size * 1024 * 1024)
+        with open(input_path, 'rb') as input_file:
+            source = input_file.read()
+        key = cache.key(source, _output_options(options))
+        if cache.fetch(key, outputs):
+            return time.perf_counter() - start, True
+        input_file = io.TextIOWrapper(io.BytesIO(source))
+    else:
+        input_file = open(input_path, 'r')
+    if options.object:
+        with input_file:
+            module = assemble_object(input_file, options.optimize)
+        with _replace_atomically(outputs[".hobj"], 'w') as object_file:
+            module.write(object_file)
+    else:
+        _write_program(input_file, outputs, options)
+    if cache is not None:
+        cache.store(key, outputs)
+        return time.perf_counter() - start, False
+    return time.perf_counter() - start, None
+
+def _write_program(input_file: typing.TextIO, outputs: typing.Dict[str, str],
+                   options: argparse.Namespace) -> None:
+    # Assembles a whole program and writes each of its requested outputs.
+    symbol_map = SymbolMap() if options.map else None
+    with input_file:
+        if options.single_pass:
+            words = assemble_words_single_pass(
+                input_file, options.optimize, symbol_map)
+        else:
+            words = assemble_words(input_file, options.optimize, symbol_map,
+                                   options.layout)
+    with _replace_atomically(outputs[".hack"], 'w') as output_file:
+        write_words(words, output_file)
+    if options.bin:
+        with _replace_atomically(outputs[".bin"], 'wb') as image_file:
+            RomImage.write(words, image_file, options.byteorder)
+    if symbol_map is not None:
+        with _replace_atomically(outputs[".map"], 'w') as map_file:
+            symbol_map.write(map_file)
+
+@functools.lru_cache(maxsize=None)
+def assembler_version() -> str:
+    """Identifies this assembler by a digest of its own source files, so
+    that changing any of them invalidates every cached output.
+
+    Returns:
+        str: the digest, as a hex string.
+    """
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".py"):
+            with open(os.path.join(directory, filename), 'rb') as source:
+                digest.update(filename.encode() + b"\0" + source.read())
+    return digest.hexdigest()
+
+def _output_options(options: argparse.Namespace) -> str:
+    # Only the options that change the bytes written belong in a cache key;
+    # --single-pass, for example, produces the exact same output.
+    return (f"bin={options.byteorder if options.bin else ''}"
+            f";optimize={options.optimize};map={options.map}"
+            f";object={options.object};layout={options.layout}")
+
+@contextlib.contextmanager
+def _replace_atomically(path: str, mode: str) -> typing.Iterator[typing.IO]:
+    # The temporary file lives next to the target, so os.replace never has
+    # to cross file systems, and is named after this process, so parallel
+    # workers never share one.
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, mode) as temporary_file:
+            yield temporary_file
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
 def first_pass(parser: Parser, symbol_table: SymbolTable) -> None:
     rom_address = 0
-    while parser.has_more_commands():
-        parser.advance()
-        command_type = parser.command_type()
-        if command_type == "A_COMMAND" or command_type == "C_COMMAND":
+    for command in parser.commands():
+        if command.command_type == L_COMMAND:
+            symbol_table.add_entry(command.symbol, rom_address)
+        else:
             rom_address += 1
-        elif command_type == "L_COMMAND":
-            symbol = parser.symbol()
-            symbol_table.add_entry(symbol, rom_address)
-
-def second_pass(parser: Parser, symbol_table: SymbolTable) -> None:
-    while parser.has_more_commands():
-        parser.advance()
-        if parser.command_type() == "A_COMMAND":
-            symbol = parser.symbol()
+
+def second_pass(parser: Parser, symbol_table: SymbolTable) -> typing.List[str]:
+    variables = []
+    for command in parser.commands():
+        if command.command_type == A_COMMAND:
+            symbol = command.symbol
             if not symbol_table.contains(symbol):
                 if not symbol.isdigit():
                     symbol_table.add_entry(
                         symbol, symbol_table.get_next_available_address())
                     symbol_table.increment_next_available_address()
+                    variables.append(symbol)
+    return variables
+
+def record_symbol_map(parser: Parser, symbol_table: SymbolTable,
+                      variables: typing.List[str],
+                      symbol_map: SymbolMap) -> None:
+    """Records the ROM layout and the variables of a parsed program.
+
+    Args:
+        parser (Parser): the parsed program.
+        symbol_table (SymbolTable): its resolved symbols.
+        variables (typing.List[str]): the variables allocated by
+            second_pass, in order.
+        symbol_map (SymbolMap): the map to record into.
+    """
+    for command, line_number in zip(parser.commands(), parser.line_numbers()):
+        if command.command_type == L_COMMAND:
+            symbol_map.add_label(command.symbol)
+        else:
+            symbol_map.add_instruction(line_number)
+    for symbol in variables:
+        symbol_map.add_variable(symbol, symbol_table.get_address(symbol))
 
 def convert_to_binary(parser: Parser, symbol_table: SymbolTable, output_file: typing.TextIO) -> None:
-    while parser.has_more_commands():
-        parser.advance()
-        if parser.command_type() == "A_COMMAND":
-            symbol = parser.symbol()
+    write_words(encode_commands(parser, symbol_table), output_file)
+
+def encode_commands(parser: Parser, symbol_table: SymbolTable) -> array.array:
+    words = array.array('H')
+    encoded_commands: typing.Dict[Command, int] = {}
+    for command in parser.commands():
+        if command.command_type == A_COMMAND:
+            symbol = command.symbol
             if symbol.isdigit():
-                address = int(symbol)
+                words.append(int(symbol))
             else:
-                address = symbol_table.get_address(symbol)
-            binary_code = '0' + format(address, '015b')
-            output_file.write(binary_code + '\n')
-        elif parser.command_type() == "C_COMMAND":
-            dest = parser.dest()
-            comp = parser.comp()
-            jump = parser.jump()
-            comp_bits = Code.comp(comp)
-            dest_bits = Code.dest(dest)
-            jump_bits = Code.jump(jump)
-            binary_code = comp_bits + dest_bits + jump_bits
-            output_file.write(binary_code + '\n')
+                words.append(symbol_table.get_address(symbol))
+        elif command.command_type == C_COMMAND:
+            word = encoded_commands.get(command)
+            if word is None:
+                word = encode_c_command(command)
+                encoded_commands[command] = word
+            words.append(word)
+    return words
 
 if "__main__" == __name__:
     # Parses the input path and calls assemble_file on each input file.
@@ -83,20 +453,98 @@ if "__main__" == __name__:
     # Both are closed automatically when the code finishes running.
     # If the output file does not exist, it is created automatically in the
     # correct path, using the correct filename.
-    if not len(sys.argv) == 2:
-        sys.exit("Invalid usage, please use: Assembler <input path>")
-    argument_path = os.path.abspath(sys.argv[1])
-    if os.path.isdir(argument_path):
-        files_to_assemble = [
-            os.path.join(argument_path, filename)
-            for filename in os.listdir(argument_path)]
+    argument_parser = argparse.ArgumentParser(
+        prog="Assembler", description="Assembles Hack .asm files.")
+    argument_parser.add_argument(
+        "input_path", help="an .asm file, a directory of .asm files, or - "
+        "to read standard input and write standard output")
+    argument_parser.add_argument(
+        "--single-pass", action="store_true",
+        help="assemble in one streaming pass, backpatching forward references")
+    argument_parser.add_argument(
+        "--optimize", action="store_true",
+        help="shrink the program with a peephole optimizer before resolving "
+        "labels")
+    argument_parser.add_argument(
+        "--layout", action="store_true",
+        help="thread jumps, drop unreachable code and reorder blocks to "
+        "turn jumps into fall-throughs (not with --single-pass)")
+    argument_parser.add_argument(
+        "--bin", action="store_true",
+        help="also write a packed 16-bit ROM image (.bin) next to each .hack")
+    argument_parser.add_argument(
+        "--map", action="store_true",
+        help="also write a symbol map (.map) of ROM addresses, source lines, "
+        "labels and RAM variables next to each .hack")
+    argument_parser.add_argument(
+        "--object", action="store_true",
+        help="write a relocatable object (.hobj) instead of a .hack, to be "
+        "combined with other objects by the Linker")
+    argument_parser.add_argument(
+        "--byteorder", choices=("little", "big"), default="little",
+        help="byte order of the words in .bin images (default: little)")
+    argument_parser.add_argument(
+        "--jobs", type=int, default=1, metavar="N",
+        help="assemble the files of a directory with N worker processes "
+        "and report per-file timing (0: one per CPU)")
+    argument_parser.add_argument(
+        "--cache", metavar="DIR",
+        help="reuse outputs of unchanged .asm files from this cache directory")
+    argument_parser.add_argument(
+        "--cache-size", type=int, default=64, metavar="MB",
+        help="evict least recently used cache entries beyond this size "
+        "(default: 64)")
+    arguments = argument_parser.parse_args()
+    if arguments.input_path == "-" and arguments.map:
+        argument_parser.error("--map needs an input file, not standard input")
+    if arguments.object and (arguments.bin or arguments.map
+                             or arguments.single_pass
+                             or arguments.input_path == "-"):
+        argument_parser.error(
+            "--object cannot be combined with --bin, --map, --single-pass "
+            "or standard input")
+    if arguments.layout and (arguments.object or arguments.single_pass
+                             or arguments.input_path == "-"):
+        argument_parser.error(
+            "--layout needs the whole program, so it cannot be combined "
+            "with --object, --single-pass or standard input")
+    if arguments.input_path == "-":
+        words = assemble_words_single_pass(sys.stdin, arguments.optimize)
+        if arguments.bin:
+            RomImage.write(words, sys.stdout.buffer, arguments.byteorder)
+        else:
+            write_words(words, sys.stdout)
     else:
-        files_to_assemble = [argument_path]
-    for input_path in files_to_assemble:
-        filename, extension = os.path.splitext(input_path)
-        if extension.lower() != ".asm":
-            continue
-        output_path = filename + ".hack"
-        with open(input_path, 'r') as input_file, \
-                open(output_path, 'w') as output_file:
-            assemble_file(input_file, output_file)
\ No newline at end of file
+        argument_path = os.path.abspath(arguments.input_path)
+        if os.path.isdir(argument_path):
+            files_to_assemble = [
+                os.path.join(argument_path, filename)
+                for filename in sorted(os.listdir(argument_path))]
+        else:
+            files_to_assemble = [argument_path]
+        files_to_assemble = [
+            input_path for input_path in files_to_assemble
+            if os.path.splitext(input_path)[1].lower() == ".asm"]
+        jobs = arguments.jobs or os.cpu_count() or 1
+        start = time.perf_counter()
+        if jobs > 1 and len(files_to_assemble) > 1:
+            with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+                results = list(executor.map(
+                    assemble_path, files_to_assemble,
+                    itertools.repeat(arguments)))
+        else:
+            results = [assemble_path(input_path, arguments)
+                       for input_path in files_to_assemble]
+        if arguments.jobs != 1:
+            # Results come back in submission order, so the summary is
+            # deterministic no matter which worker finished first.
+            for input_path, (seconds, cache_hit) in zip(
+                    files_to_assemble, results):
+                print(f"{os.path.basename(input_path)}: {seconds * 1000:.1f} ms"
+                      + (" (cached)" if cache_hit else ""))
+            print(f"{len(files_to_assemble)} files assembled with {jobs} "
+                  f"jobs in {(time.perf_counter() - start) * 1000:.1f} ms")
+        if arguments.cache:
+            cache_hits = sum(cache_hit is True for _, cache_hit in results)
+            print(f"cache: {cache_hits} hits, "
+                  f"{len(results) - cache_hits} misses")
@@ -5,9 +5,41 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import array
+import sys
 import typing
 
 
+A_COMMAND = "A_COMMAND"
+C_COMMAND = "C_COMMAND"
+L_COMMAND = "L_COMMAND"
+
+
+class Command:
+    """A single assembly command, decoded once into its fields.
+
+    Identical source lines share the same Command object, so a record must
+    never be modified after it is created. Fields that do not apply to the
+    command's type are None, just like the matching Parser accessors.
+    """
+
+    __slots__ = ("command_type", "symbol", "dest", "comp", "jump")
+
+    def __init__(self, command_type: str, symbol: typing.Optional[str] = None,
+                 dest: typing.Optional[str] = None,
+                 comp: typing.Optional[str] = None,
+                 jump: typing.Optional[str] = None) -> None:
+        self.command_type = command_type
+        self.symbol = symbol
+        self.dest = dest
+        self.comp = comp
+        self.jump = jump
+
+
+# A command together with the (1-based) source line it was read from.
+NumberedCommand = typing.Tuple[int, Command]
+
+
 class Parser:
     """Encapsulates access to the input code. Reads an assembly program
     by reading each command line-by-line, parses the current command,
@@ -15,26 +47,65 @@ class Parser:
     and symbols). In addition, removes all white space and comments.
     """
 
-    def __init__(self, input_file: typing.TextIO) -> None:
+    def __init__(self, input_file: typing.Iterable[str]) -> None:
         """Opens the input file and gets ready to parse it.
 
         Args:
-            input_file (typing.TextIO): input file.
+            input_file (typing.Iterable[str]): input file, or any other
+                iterable of lines, such as a list of strings.
         """
         # Your code goes here!
         # A good place to start is to read all the lines of the input:
-        input_lines = input_file.read().splitlines()
-        cleaned_lines = []
-        for line in input_lines:
-            line = self._remove_comments_and_whitespace(line)
-            if line:
-                cleaned_lines.append(line)
-        self._commands = cleaned_lines
+        self._commands: typing.List[Command] = []
+        self._line_numbers = array.array('I')
+        for line_number, command in Parser.stream_numbered(input_file):
+            self._commands.append(command)
+            self._line_numbers.append(line_number)
         self._current_index = -1
         self._current_command = None
-        pass
 
-    def _remove_comments_and_whitespace(self, line: str) -> str:
+    @staticmethod
+    def stream(input_file: typing.TextIO) -> typing.Iterator[Command]:
+        """Decodes the input lazily, without ever holding all of its text.
+
+        Lines are pulled through the file object's own buffered reader, so
+        only one buffer of input is resident at a time. This is what the
+        single-pass assembler consumes, and it works on pipes such as stdin.
+
+        Args:
+            input_file (typing.TextIO): input file.
+
+        Returns:
+            typing.Iterator[Command]: the decoded commands, in order.
+        """
+        for _, command in Parser.stream_numbered(input_file):
+            yield command
+
+    @staticmethod
+    def stream_numbered(input_file: typing.Iterable[str]
+                        ) -> typing.Iterator[NumberedCommand]:
+        """Like stream, but also yields the source line of every command.
+
+        Args:
+            input_file (typing.Iterable[str]): input file, or any other
+                iterable of lines.
+
+        Returns:
+            typing.Iterator[NumberedCommand]: (line number, command) pairs,
+            in order.
+        """
+        decoded_commands: typing.Dict[str, Command] = {}
+        for line_number, line in enumerate(input_file, 1):
+            line = Parser._remove_comments_and_whitespace(line)
+            if line:
+                command = decoded_commands.get(line)
+                if command is None:
+                    command = Parser._decode(line)
+                    decoded_commands[line] = command
+                yield line_number, command
+
+    @staticmethod
+    def _remove_comments_and_whitespace(line: str) -> str:
         if '//' in line:
             line = line[:line.index('//')]
 
@@ -43,6 +114,49 @@ class Parser:
 
         return line
 
+    @staticmethod
+    def _decode(line: str) -> Command:
+        if line.startswith('@'):
+            return Command(A_COMMAND, symbol=sys.intern(line[1:]))
+        elif line.startswith('(') and line.endswith(')'):
+            return Command(L_COMMAND, symbol=sys.intern(line[1:-1]))
+        dest, equals, comp = line.partition('=')
+        if not equals:
+            dest, comp = '', line if ';' in line else ''
+        comp, _, jump = comp.partition(';')
+        return Command(C_COMMAND, dest=sys.intern(dest),
+                       comp=sys.intern(comp), jump=sys.intern(jump))
+
+    def commands(self) -> typing.List[Command]:
+        """Returns every decoded command of the input, in order. Passes that
+        do not need the cursor API can iterate this list directly.
+
+        Returns:
+            typing.List[Command]: the decoded commands.
+        """
+        return self._commands
+
+    def line_numbers(self) -> typing.Sequence[int]:
+        """Returns the source line of every command, parallel to commands().
+
+        Returns:
+            typing.Sequence[int]: the 1-based line numbers.
+        """
+        return self._line_numbers
+
+    def set_commands(self, commands: typing.List[Command],
+                     line_numbers: typing.Sequence[int]) -> None:
+        """Replaces the decoded commands, for example with an optimized
+        rewrite of them, and rewinds the cursor.
+
+        Args:
+            commands (typing.List[Command]): the new commands.
+            line_numbers (typing.Sequence[int]): their source lines.
+        """
+        self._commands = commands
+        self._line_numbers = array.array('I', line_numbers)
+        self.reset()
+
     def has_more_commands(self) -> bool:
         """Are there more commands in the input?
 
@@ -67,12 +181,7 @@ class Parser:
             "C_COMMAND" for dest=comp;jump
             "L_COMMAND" (actually, pseudo-command) for (Xxx) where Xxx is a symbol
         """
-        if self._current_command.startswith('@'):
-            return "A_COMMAND"
-        elif self._current_command.startswith('(') and self._current_command.endswith(')'):
-            return "L_COMMAND"
-        else:
-            return "C_COMMAND"
+        return self._current_command.command_type
 
     def symbol(self) -> str:
         """
@@ -81,11 +190,7 @@ class Parser:
             (Xxx). Should be called only when command_type() is "A_COMMAND" or
             "L_COMMAND".
         """
-        if self.command_type() == "A_COMMAND":
-            return self._current_command[1:]
-        elif self.command_type() == "L_COMMAND":
-            return self._current_command[1:-1]
-        pass
+        return self._current_command.symbol
 
     def dest(self) -> str:
         """
@@ -93,12 +198,7 @@ class Parser:
             str: the dest mnemonic in the current C-command. Should be called
             only when commandType() is "C_COMMAND".
         """
-        if self.command_type() == "C_COMMAND":
-            if '=' in self._current_command:
-                return self._current_command.split('=')[0]
-            else:
-                return ''
-        pass
+        return self._current_command.dest
 
     def comp(self) -> str:
         """
@@ -106,14 +206,7 @@ class Parser:
             str: the comp mnemonic in the current C-command. Should be called
             only when commandType() is "C_COMMAND".
         """
-        if self.command_type() == "C_COMMAND":
-            if '=' in self._current_command:
-                return self._current_command.split('=')[1].split(';')[0]
-            elif ';' in self._current_command:
-                return self._current_command.split(';')[0]
-            else:
-                return ''
-        pass
+        return self._current_command.comp
 
     def jump(self) -> str:
         """
@@ -121,12 +214,7 @@ class Parser:
             str: the jump mnemonic in the current C-command. Should be called
             only when commandType() is "C_COMMAND".
         """
-        if self.command_type() == "C_COMMAND":
-            if ';' in self._current_command:
-                return self._current_command.split(';')[1]
-            else:
-                return ''
-        pass
+        return self._current_command.jump
 
     def get_current_index(self) -> int:
         """Returns the current index of the parser in the command list.
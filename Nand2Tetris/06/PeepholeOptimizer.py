@@ -0,0 +1,210 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import (Command, NumberedCommand, A_COMMAND, C_COMMAND,
+                    L_COMMAND)
+
+
+# The replacement for a folded push-then-pop: A is left pointing at the
+# stack top, exactly where the original sequence left it.
+LOAD_STACK_TOP = Command(C_COMMAND, dest='A', comp='M', jump='')
+LOAD_SP = Command(A_COMMAND, symbol='SP')
+
+
+class PeepholeOptimizer:
+    """Rewrites a stream of decoded commands into a shorter, equivalent one.
+
+    The rewrite runs before labels are resolved, so the first pass simply
+    assigns ROM addresses to the shortened program. Commands are optimized
+    one basic block at a time: a (LABEL) may be reached from anywhere, so
+    nothing is assumed about the registers across it, and only one block is
+    held in memory at a time. The rewrites are:
+
+    - an @X that loads a value A already holds is dropped;
+    - a push "@SP, AM=M+1, A=A-1" followed by a pop "@SP, AM=M-1", with at
+      most one store in between, is folded into "@SP, A=M";
+    - a D=M right after M=D is dropped, since D already holds that value;
+    - a C-command whose only effect is to write D is dropped when D is
+      overwritten before it is read.
+
+    Since the rewrite moves instructions, it is only valid for programs that
+    jump to labels. A jump to a literal ROM address, as in the symbol-less
+    test programs, is rejected with a ValueError.
+    """
+
+    @staticmethod
+    def optimize(commands: typing.Iterable[Command]
+                 ) -> typing.Iterator[Command]:
+        """Optimizes the given commands lazily, block by block.
+
+        Args:
+            commands (typing.Iterable[Command]): the decoded commands.
+
+        Returns:
+            typing.Iterator[Command]: the optimized commands, in order.
+        """
+        for _, command in PeepholeOptimizer.optimize_numbered(
+                enumerate(commands)):
+            yield command
+
+    @staticmethod
+    def optimize_numbered(numbered: typing.Iterable[NumberedCommand]
+                          ) -> typing.Iterator[NumberedCommand]:
+        """Like optimize, but for (line number, command) pairs, as yielded
+        by Parser.stream_numbered. Every surviving command keeps its source
+        line, and a folded sequence takes the line of its first command.
+
+        Args:
+            numbered (typing.Iterable[NumberedCommand]): the decoded
+                commands, with their line numbers.
+
+        Returns:
+            typing.Iterator[NumberedCommand]: the optimized commands, with
+            their line numbers, in order.
+        """
+        block: typing.List[NumberedCommand] = []
+        for line_number, command in numbered:
+            if command.command_type == L_COMMAND:
+                yield from PeepholeOptimizer.optimize_block(block)
+                block = []
+                yield line_number, command
+            else:
+                block.append((line_number, command))
+        yield from PeepholeOptimizer.optimize_block(block)
+
+    @staticmethod
+    def optimize_block(block: typing.List[NumberedCommand]
+                       ) -> typing.List[NumberedCommand]:
+        """Optimizes a basic block until no rewrite applies any more.
+
+        Args:
+            block (typing.List[NumberedCommand]): A- and C-commands, without
+                labels, with their line numbers.
+
+        Returns:
+            typing.List[NumberedCommand]: the optimized block.
+        """
+        PeepholeOptimizer._check_jump_targets(block)
+        while True:
+            length = len(block)
+            block = PeepholeOptimizer._fold_push_pop(block)
+            block = PeepholeOptimizer._drop_redundant_loads(block)
+            block = PeepholeOptimizer._drop_dead_stores_to_d(block)
+            if len(block) == length:
+                return block
+
+    @staticmethod
+    def _check_jump_targets(block: typing.List[NumberedCommand]) -> None:
+        loaded = None
+        for line_number, command in block:
+            if command.command_type == A_COMMAND:
+                loaded = command.symbol
+            else:
+                if command.jump and loaded is not None and loaded.isdigit():
+                    raise ValueError(
+                        f"Line {line_number}: cannot optimize a jump to ROM "
+                        f"address {loaded}; use a label instead")
+                if 'A' in command.dest:
+                    loaded = None
+
+    @staticmethod
+    def _fold_push_pop(block: typing.List[NumberedCommand]
+                       ) -> typing.List[NumberedCommand]:
+        result: typing.List[NumberedCommand] = []
+        index = 0
+        while index < len(block):
+            middle = PeepholeOptimizer._push_pop_middle(block, index)
+            if middle is None:
+                result.append(block[index])
+                index += 1
+            else:
+                line_number = block[index][0]
+                result.append((line_number, LOAD_SP))
+                result.append((line_number, LOAD_STACK_TOP))
+                result.extend(middle)
+                index += 5 + len(middle)
+        return result
+
+    @staticmethod
+    def _push_pop_middle(block: typing.List[NumberedCommand], index: int
+                         ) -> typing.Optional[typing.List[NumberedCommand]]:
+        # Returns the commands between the push and the pop that start at
+        # index, or None if there is no such pair there.
+        if not (_is_load(block, index, 'SP')
+                and _is_c(block, index + 1, 'AM', 'M+1')
+                and _is_c(block, index + 2, 'A', 'A-1')):
+            return None
+        for middle_length in (0, 1):
+            pop = index + 3 + middle_length
+            if _is_load(block, pop, 'SP') and _is_c(block, pop + 1, 'AM', 'M-1'):
+                middle = block[index + 3:pop]
+                if all(command.command_type == C_COMMAND
+                       and 'A' not in command.dest and not command.jump
+                       for _, command in middle):
+                    return middle
+        return None
+
+    @staticmethod
+    def _drop_redundant_loads(block: typing.List[NumberedCommand]
+                              ) -> typing.List[NumberedCommand]:
+        result: typing.List[NumberedCommand] = []
+        loaded = None
+        previous = None
+        for line_number, command in block:
+            if command.command_type == A_COMMAND:
+                if command.symbol == loaded:
+                    continue
+                loaded = command.symbol
+            else:
+                if (command.dest == 'D' and command.comp == 'M'
+                        and not command.jump and previous is not None
+                        and previous.dest == 'M' and previous.comp == 'D'
+                        and not previous.jump):
+                    continue
+                if 'A' in command.dest:
+                    loaded = None
+            result.append((line_number, command))
+            previous = command if command.command_type == C_COMMAND else None
+        return result
+
+    @staticmethod
+    def _drop_dead_stores_to_d(block: typing.List[NumberedCommand]
+                               ) -> typing.List[NumberedCommand]:
+        # Walks the block backwards, tracking whether D may still be read.
+        # At the end of the block, and at every jump, D is assumed live.
+        result: typing.List[NumberedCommand] = []
+        d_live = True
+        for line_number, command in reversed(block):
+            if command.command_type == C_COMMAND:
+                if command.jump:
+                    d_live = True
+                elif command.dest == 'D' and not d_live:
+                    continue
+                elif 'D' in command.dest:
+                    d_live = False
+                if 'D' in command.comp:
+                    d_live = True
+            result.append((line_number, command))
+        result.reverse()
+        return result
+
+
+def _is_load(block: typing.List[NumberedCommand], index: int,
+             symbol: str) -> bool:
+    if index >= len(block):
+        return False
+    command = block[index][1]
+    return command.command_type == A_COMMAND and command.symbol == symbol
+
+def _is_c(block: typing.List[NumberedCommand], index: int, dest: str,
+          comp: str) -> bool:
+    if index >= len(block):
+        return False
+    command = block[index][1]
+    return (command.command_type == C_COMMAND and command.dest == dest
+            and command.comp == comp and not command.jump)
@@ -0,0 +1,124 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import array
+import mmap
+import os
+import sys
+import typing
+
+
+class RomImage:
+    """Reads and writes packed ROM images.
+
+    A ROM image (.bin) is the raw sequence of 16-bit machine words, two bytes
+    per word and nothing else: no header, no separators. The byte order is
+    chosen by the writer, and the reader must be told the same one. Compared
+    to the textual .hack format (17 bytes per word) an image is about 8 times
+    smaller, and it can be loaded without any parsing at all.
+    """
+
+    @staticmethod
+    def write(words: typing.Sequence[int], image_file: typing.BinaryIO,
+              byteorder: str = "little") -> None:
+        """Writes the given words as a packed image.
+
+        Args:
+            words (typing.Sequence[int]): the encoded 16-bit words.
+            image_file (typing.BinaryIO): a file opened for binary writing.
+            byteorder (str): "little" or "big".
+        """
+        image = array.array('H', words)
+        if byteorder != sys.byteorder:
+            image.byteswap()
+        image_file.write(image.tobytes())
+
+    @staticmethod
+    def load(image_path: str,
+             byteorder: str = "little") -> typing.Sequence[int]:
+        """Loads an image by memory-mapping it.
+
+        When the image's byte order matches the machine's, the words are
+        returned as a read-only view of the mapping, without copying them.
+        Otherwise they are copied once into a byte-swapped array('H').
+
+        Args:
+            image_path (str): path of the .bin image.
+            byteorder (str): "little" or "big".
+
+        Returns:
+            typing.Sequence[int]: the words of the image, indexable by ROM
+            address.
+        """
+        with open(image_path, 'rb') as image_file:
+            size = os.fstat(image_file.fileno()).st_size
+            if size % 2:
+                raise ValueError(
+                    f"{image_path} is not a packed 16-bit ROM image")
+            if size == 0:
+                return array.array('H')
+            mapping = mmap.mmap(
+                image_file.fileno(), 0, access=mmap.ACCESS_READ)
+        words = memoryview(mapping).cast('H')
+        if byteorder == sys.byteorder:
+            return words
+        swapped = array.array('H', words)
+        swapped.byteswap()
+        return swapped
+
+    @staticmethod
+    def hack_to_bin(hack_path: str, image_path: str,
+                    byteorder: str = "little") -> None:
+        """Converts a textual .hack file into a packed image.
+
+        Args:
+            hack_path (str): path of the .hack file to read.
+            image_path (str): path of the .bin image to write.
+            byteorder (str): "little" or "big".
+        """
+        with open(hack_path, 'r') as hack_file:
+            words = array.array(
+                'H', (int(line, 2) for line in hack_file if line.strip()))
+        with open(image_path, 'wb') as image_file:
+            RomImage.write(words, image_file, byteorder)
+
+    @staticmethod
+    def bin_to_hack(image_path: str, hack_path: str,
+                    byteorder: str = "little") -> None:
+        """Converts a packed image back into a textual .hack file.
+
+        Args:
+            image_path (str): path of the .bin image to read.
+            hack_path (str): path of the .hack file to write.
+            byteorder (str): "little" or "big".
+        """
+        words = RomImage.load(image_path, byteorder)
+        with open(hack_path, 'w') as hack_file:
+            hack_file.write(''.join(format(word, '016b') + '\n'
+                                    for word in words))
+
+
+if "__main__" == __name__:
+    # Converts between .hack and .bin, depending on the input's extension.
+    argument_parser = argparse.ArgumentParser(
+        prog="RomImage",
+        description="Converts between .hack text and packed .bin ROM images.")
+    argument_parser.add_argument("input_path", help="a .hack or .bin file")
+    argument_parser.add_argument(
+        "--byteorder", choices=("little", "big"), default="little",
+        help="byte order of the words in the .bin image (default: little)")
+    arguments = argument_parser.parse_args()
+    filename, extension = os.path.splitext(os.path.abspath(arguments.input_path))
+    if extension.lower() == ".hack":
+        RomImage.hack_to_bin(
+            arguments.input_path, filename + ".bin", arguments.byteorder)
+    elif extension.lower() == ".bin":
+        RomImage.bin_to_hack(
+            arguments.input_path, filename + ".hack", arguments.byteorder)
+    else:
+        sys.exit("Invalid usage, please use: RomImage <.hack or .bin path>")
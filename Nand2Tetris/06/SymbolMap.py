@@ -0,0 +1,133 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import array
+import bisect
+import typing
+
+
+class SymbolMap:
+    """Links the ROM addresses of an assembled program back to its source.
+
+    For every ROM address the map holds the source line the instruction was
+    read from, and the nearest label declared at or before it, which is
+    what a profiler needs to attribute a hot address to a VM function. It
+    also holds every RAM variable allocated by the assembler.
+
+    A map file (.map) is tab-separated text. A "ROM <count>" header is
+    followed by one "<address> <line> <label>" row per instruction, where
+    the label is empty before the first one, and a "RAM <count>" header is
+    followed by one "<address> <symbol>" row per variable.
+    """
+
+    def __init__(self) -> None:
+        """Creates an empty map."""
+        self._line_numbers = array.array('I')
+        self._label_addresses: typing.List[int] = []
+        self._labels: typing.List[str] = []
+        self._variables: typing.List[typing.Tuple[int, str]] = []
+
+    def add_instruction(self, line_number: int) -> None:
+        """Records the next ROM address.
+
+        Args:
+            line_number (int): the source line of its instruction.
+        """
+        self._line_numbers.append(line_number)
+
+    def add_label(self, symbol: str) -> None:
+        """Records a label declared at the next ROM address.
+
+        Args:
+            symbol (str): the label.
+        """
+        self._label_addresses.append(len(self._line_numbers))
+        self._labels.append(symbol)
+
+    def add_variable(self, symbol: str, address: int) -> None:
+        """Records a RAM variable.
+
+        Args:
+            symbol (str): the variable.
+            address (int): its RAM address.
+        """
+        self._variables.append((address, symbol))
+
+    def line_number(self, address: int) -> int:
+        """
+        Args:
+            address (int): a ROM address.
+
+        Returns:
+            int: the source line of the instruction at the address.
+        """
+        return self._line_numbers[address]
+
+    def label(self, address: int) -> typing.Optional[str]:
+        """
+        Args:
+            address (int): a ROM address.
+
+        Returns:
+            typing.Optional[str]: the last label declared at or before the
+            address, or None if there is none.
+        """
+        index = bisect.bisect_right(self._label_addresses, address)
+        return self._labels[index - 1] if index else None
+
+    def variables(self) -> typing.List[typing.Tuple[int, str]]:
+        """
+        Returns:
+            typing.List[typing.Tuple[int, str]]: (RAM address, symbol) of
+            every variable, in order of allocation.
+        """
+        return self._variables
+
+    def write(self, map_file: typing.TextIO) -> None:
+        """Writes the map in the .map format.
+
+        Args:
+            map_file (typing.TextIO): a file opened for text writing.
+        """
+        rows = [f"ROM\t{len(self._line_numbers)}\n"]
+        labels = iter(zip(self._label_addresses, self._labels))
+        next_label = next(labels, None)
+        label = ''
+        for address, line_number in enumerate(self._line_numbers):
+            while next_label is not None and next_label[0] <= address:
+                label = next_label[1]
+                next_label = next(labels, None)
+            rows.append(f"{address}\t{line_number}\t{label}\n")
+        rows.append(f"RAM\t{len(self._variables)}\n")
+        rows.extend(f"{address}\t{symbol}\n"
+                    for address, symbol in self._variables)
+        map_file.write(''.join(rows))
+
+    @staticmethod
+    def load(map_file: typing.TextIO) -> "SymbolMap":
+        """Reads a map written by write.
+
+        Args:
+            map_file (typing.TextIO): a file opened for text reading.
+
+        Returns:
+            SymbolMap: the map.
+        """
+        symbol_map = SymbolMap()
+        lines = map_file.read().splitlines()
+        rom_size = int(lines[0].split('\t')[1])
+        label = ''
+        for row in lines[1:rom_size + 1]:
+            _, line_number, row_label = row.split('\t')
+            if row_label != label:
+                symbol_map.add_label(row_label)
+                label = row_label
+            symbol_map.add_instruction(int(line_number))
+        for row in lines[rom_size + 2:]:
+            address, symbol = row.split('\t')
+            symbol_map.add_variable(symbol, int(address))
+        return symbol_map
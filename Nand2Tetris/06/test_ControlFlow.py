@@ -0,0 +1,35 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import io
+import unittest
+from ControlFlow import ControlFlowGraph
+from Parser import Parser
+
+
+def build_graph(lines):
+    return ControlFlowGraph(Parser(io.StringIO("\n".join(lines))).commands())
+
+
+class ControlFlowGraphTest(unittest.TestCase):
+
+    def test_variable_load_is_not_indirect(self):
+        graph = build_graph(['@i', 'M=0', '(L)', '@i', 'M=M+1', '@L',
+                             '0;JMP'])
+        loop_block = next(block for block in graph.blocks
+                          if "L" in block.labels)
+        self.assertFalse(loop_block.indirect)
+        self.assertEqual(loop_block.successors, [loop_block.index])
+        self.assertEqual(len(graph.loops()), 1)
+
+    def test_computed_jump_is_indirect(self):
+        graph = build_graph(['@R14', 'A=M', '0;JMP'])
+        self.assertTrue(graph.blocks[0].indirect)
+
+
+if "__main__" == __name__:
+    unittest.main()
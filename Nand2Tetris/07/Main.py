@@ -8,10 +8,22 @@ Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 import os
 import sys
 import typing
-from Parser import Parser
+from Parser import Parser, C_ARITHMETIC, C_PUSH, C_POP
 from CodeWriter import CodeWriter
 
 
+# How to translate each opcode, as a function of the code writer and the
+# command's arguments. Commands of other opcodes are skipped.
+DISPATCH_TABLE = {
+    C_ARITHMETIC: lambda code_writer, arg1, arg2:
+        code_writer.write_arithmetic(arg1),
+    C_PUSH: lambda code_writer, arg1, arg2:
+        code_writer.write_push_pop("C_PUSH", arg1, arg2),
+    C_POP: lambda code_writer, arg1, arg2:
+        code_writer.write_push_pop("C_POP", arg1, arg2)
+}
+
+
 def translate_file(
         input_file: typing.TextIO, output_file: typing.TextIO) -> None:
     """Translates a single file.
@@ -26,15 +38,10 @@ def translate_file(
     code_writer.set_file_name(os.path.splitext(
         os.path.basename(input_file.name))[0])
     
-    parser = Parser(input_file)
-    while parser.has_more_commands():
-        parser.advance()
-        command_type = parser.command_type()
-
-        if command_type == "C_ARITHMETIC":
-            code_writer.write_arithmetic(parser.arg1())
-        elif command_type in {"C_PUSH", "C_POP"}:
-            code_writer.write_push_pop(command_type, parser.arg1(), parser.arg2())
+    for opcode, arg1, arg2 in Parser(input_file).records():
+        translate = DISPATCH_TABLE.get(opcode)
+        if translate is not None:
+            translate(code_writer, arg1, arg2)
 
 
 if "__main__" == __name__:
@@ -0,0 +1,105 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from VMOptimizer import VMCommand
+
+
+# The name and commands of every file of a program, see Main.read_program.
+Program = typing.List[typing.Tuple[str, typing.List[VMCommand]]]
+
+# The function the bootstrap code calls.
+ENTRY_POINT = "Sys.init"
+
+
+class CallGraph:
+    """The functions of a whole program, and the functions each one calls.
+
+    A function's commands run from its "function" command to the next one,
+    or to the end of its file. Commands before the first function of a file
+    belong to no function.
+    """
+
+    def __init__(self, program: Program) -> None:
+        """Builds the call graph of a program.
+
+        Args:
+            program (Program): the parsed files of the program.
+        """
+        self.functions: typing.Dict[str, typing.List[VMCommand]] = {}
+        self.callees: typing.Dict[str, typing.Set[str]] = {}
+        for _, commands in program:
+            current = None
+            for command in commands:
+                if command[0] == "C_FUNCTION":
+                    current = command[1]
+                    self.functions[current] = []
+                    self.callees[current] = set()
+                if current is None:
+                    continue
+                self.functions[current].append(command)
+                if command[0] == "C_CALL":
+                    self.callees[current].add(command[1])
+
+    def reachable(self, root: str = ENTRY_POINT) -> typing.Set[str]:
+        """
+        Args:
+            root (str): the function to start from.
+
+        Returns:
+            typing.Set[str]: the functions that root calls, directly or not,
+            including root itself. Calls to functions the program does not
+            define are ignored.
+        """
+        reached = set()
+        stack = [root] if root in self.functions else []
+        while stack:
+            function = stack.pop()
+            if function in reached:
+                continue
+            reached.add(function)
+            stack.extend(callee for callee in self.callees[function]
+                         if callee in self.functions)
+        return reached
+
+    @staticmethod
+    def remove_dead_functions(program: Program
+                              ) -> typing.Tuple[Program, str]:
+        """Removes the functions that cannot be called from Sys.init.
+
+        Args:
+            program (Program): the parsed files of the program.
+
+        Returns:
+            typing.Tuple[Program, str]: the program without its unreachable
+            functions, and a report of what was removed. A program without
+            Sys.init is returned as it is, since it has no known entry point.
+        """
+        call_graph = CallGraph(program)
+        if ENTRY_POINT not in call_graph.functions:
+            return program, f"{ENTRY_POINT} not found, nothing removed"
+        reached = call_graph.reachable()
+        result = []
+        for file_name, commands in program:
+            kept = []
+            keep = True
+            for command in commands:
+                if command[0] == "C_FUNCTION":
+                    keep = command[1] in reached
+                if keep:
+                    kept.append(command)
+            result.append((file_name, kept))
+        removed = sorted(set(call_graph.functions) - reached)
+        removed_commands = sum(len(call_graph.functions[function])
+                               for function in removed)
+        total_commands = sum(len(commands) for _, commands in program)
+        report = (f"removed {len(removed)} of {len(call_graph.functions)} "
+                  f"functions, {removed_commands} of {total_commands} VM "
+                  f"commands")
+        if removed:
+            report += ": " + ", ".join(removed)
+        return result, report
@@ -5,25 +5,92 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import io
 import typing
 
 
+# Largest segment offset that write_move and write_store reach by stepping
+# A forward, rather than by computing the address into R13 first.
+MAX_STEPPED_OFFSET = 6
+
+# Number of pieces of assembly that CodeWriter collects before writing them
+# to the output stream in one call.
+BUFFER_SIZE = 4096
+
+# Comparisons that can be translated to a call to a routine shared by the
+# whole program, see choose_shared_comparisons.
+COMPARISONS = ("eq", "gt", "lt")
+
+# Instructions in a call to a shared comparison: "@ret, D=A, @$OP, 0;JMP".
+COMPARISON_CALL_SIZE = 4
+
+# Instructions a shared comparison routine adds to the inline translation:
+# saving the return address, and "@R15, A=M, 0;JMP".
+COMPARISON_ROUTINE_OVERHEAD = 5
+
+# Arithmetic commands on a stack top that is in D, which leave the result
+# in D.
+CACHED_ARITHMETIC = {
+    "add": "@SP\nAM=M-1\nD=D+M\n",
+    "sub": "@SP\nAM=M-1\nD=M-D\n",
+    "and": "@SP\nAM=M-1\nD=D&M\n",
+    "or": "@SP\nAM=M-1\nD=D|M\n",
+    "neg": "D=-D\n",
+    "not": "D=!D\n",
+    "shiftleft": "D=D<<\n",
+    "shiftright": "D=D>>\n"
+}
+
+
 class CodeWriter:
     """Translates VM commands into Hack assembly code."""
 
-    def __init__(self, output_stream: typing.TextIO) -> None:
+    def __init__(self, output_stream: typing.TextIO,
+                 shared_comparisons: typing.Collection[str] = (),
+                 shared_calls: bool = False,
+                 cache_stack_top: bool = False,
+                 label_namespace: str = "") -> None:
         """Initializes the CodeWriter.
 
+        The assembly is collected in a buffer, and only written to the output
+        stream when it is large, so call flush after the last command.
+
         Args:
             output_stream (typing.TextIO): output stream.
+            shared_comparisons (typing.Collection[str]): the comparisons to
+                translate to calls to a shared routine, which write_prelude
+                writes, instead of inline code.
+            shared_calls (bool): if this is True, translates every call and
+                return to a jump to the $CALL and $RETURN routines, which
+                write_prelude writes.
+            cache_stack_top (bool): if this is True, the value a command
+                pushes is kept in D rather than written to the stack, as long
+                as the following commands can use it from there. Call
+                flush_stack_top after the last command.
+            label_namespace (str): a prefix of the numbers in the labels this
+                writer generates, so that writers with different namespaces
+                can translate the files of one program independently.
         """
         # Your code goes here!
         # Note that you can write to output_stream like so:
         # output_stream.write("Hello world! \n")
 
         self._output_stream = output_stream
+        self._buffer: typing.List[str] = []
+        # The assembly of commands that do not depend on generated labels,
+        # by file name (which static entries depend on), and then by
+        # (command, segment, index) or a similar key, see _write_template.
+        self._template_caches: typing.Dict[
+            typing.Optional[str], typing.Dict[typing.Tuple, str]] = {}
+        self._templates = self._template_caches.setdefault(None, {})
         self._label_counter = 0
+        self._label_namespace = label_namespace
         self._current_file_name = None
+        self._shared_comparisons = frozenset(shared_comparisons)
+        self._shared_calls = shared_calls
+        self._cache_stack_top = cache_stack_top
+        # Whether the stack top is in D rather than at RAM[SP-1].
+        self._top_in_d = False
         
         self._arithmetic_commands = {
             "add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not",
@@ -44,7 +111,7 @@ class CodeWriter:
     def write_init(self) -> None:
         """Writes the assembly code that initializes the VM translator.
         """
-        self._output_stream.write(
+        self._write(
             "// Bootstrap code\n"
             "@256\n"
             "D=A\n"
@@ -55,6 +122,124 @@ class CodeWriter:
         self.write_call("Sys.init", 0)
 
 
+    def write_prelude(self) -> None:
+        """Writes the routines shared by the whole program, if there are
+        any, with a jump over them. It should be written once, before the
+        first VM command.
+        """
+        if not self._shared_comparisons and not self._shared_calls:
+            return
+        self._write(
+            "// Shared routines\n"
+            "@$PRELUDE_END\n"
+            "0;JMP\n")
+        if self._shared_calls:
+            # The caller passes the callee's address in R13, the number of
+            # arguments in R14 and the return address in D.
+            self._write("($CALL)\n")
+            self._write_frame(None)
+            self._write(
+                "@R13\n"
+                "A=M\n"
+                "0;JMP\n"
+                "($RETURN)\n")
+            self._write_inline_return()
+        for command in COMPARISONS:
+            if command not in self._shared_comparisons:
+                continue
+            # The caller passes the return address in D. The routine uses
+            # the inline translation, which only uses R13 and R14.
+            self._write(
+                f"(${command.upper()})\n"
+                "@R15\n"
+                "M=D\n")
+            self._write_inline_arithmetic(command)
+            self._write(
+                "@R15\n"
+                "A=M\n"
+                "0;JMP\n")
+        self._write("($PRELUDE_END)\n")
+
+    @staticmethod
+    def choose_shared_comparisons(counts: typing.Mapping[str, int]
+                                  ) -> typing.Set[str]:
+        """Chooses the comparisons that take less code as shared routines
+        than inline.
+
+        Args:
+            counts (typing.Mapping[str, int]): the number of uses of every
+                arithmetic command in the program.
+
+        Returns:
+            typing.Set[str]: the comparisons to pass as shared_comparisons.
+        """
+        shared = set()
+        for command in COMPARISONS:
+            uses = counts.get(command, 0)
+            inline_size = CodeWriter.inline_size(command)
+            if (uses * COMPARISON_CALL_SIZE + inline_size
+                    + COMPARISON_ROUTINE_OVERHEAD < uses * inline_size):
+                shared.add(command)
+        return shared
+
+    @staticmethod
+    def inline_size(command: str) -> int:
+        """
+        Args:
+            command (str): an arithmetic command.
+
+        Returns:
+            int: the number of instructions in its inline translation.
+        """
+        text = io.StringIO()
+        code_writer = CodeWriter(text)
+        code_writer._write_inline_arithmetic(command)
+        code_writer.flush()
+        return sum(1 for line in text.getvalue().splitlines()
+                   if not line.startswith(("//", "(")))
+
+    def flush(self) -> None:
+        """Writes the buffered assembly to the output stream. Should be
+        called after the last command, and before the output stream is used
+        by anything else.
+        """
+        if self._buffer:
+            self._output_stream.write("".join(self._buffer))
+            self._buffer.clear()
+
+    def _write(self, assembly: str) -> None:
+        self._buffer.append(assembly)
+        if len(self._buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def _write_template(self, key: typing.Tuple,
+                        build: typing.Callable[..., str], *args) -> None:
+        # Writes build(*args), which is only called the first time key is
+        # written in the current file.
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = build(*args)
+        self._write(template)
+
+    def _next_label_id(self) -> str:
+        # A suffix that makes the labels of one translated command unique.
+        label_id = f"{self._label_namespace}{self._label_counter}"
+        self._label_counter += 1
+        return label_id
+
+    def flush_stack_top(self) -> None:
+        """Writes the stack top to the stack, if it is only kept in D. Code
+        that is entered by a jump, and the code after the last command,
+        expect the whole stack in RAM.
+        """
+        if self._top_in_d:
+            self._write(
+                "@SP\n"
+                "AM=M+1\n"
+                "A=A-1\n"
+                "M=D\n")
+            self._top_in_d = False
+
     def set_file_name(self, filename: str) -> None:
         """Informs the code writer that the translation of a new VM file is 
         started.
@@ -70,10 +255,11 @@ class CodeWriter:
         # static variables belonging to different files.
         # To avoid problems with Linux/Windows/MacOS differences with regards
         # to filenames and paths, you are advised to parse the filename in
-        # the function "translate_file" in Main.py using python's os library,
+        # the function "read_program" in Main.py using python's os library,
         # For example, using code similar to:
         # input_filename, input_extension = os.path.splitext(os.path.basename(input_file.name))
         self._current_file_name = filename
+        self._templates = self._template_caches.setdefault(filename, {})
 
     def write_arithmetic(self, command: str) -> None:
         """Writes assembly code that is the translation of the given 
@@ -85,10 +271,28 @@ class CodeWriter:
             command (str): an arithmetic command.
         """
         # Your code goes here!
+        if self._top_in_d and command in CACHED_ARITHMETIC:
+            self._write(
+                f"// {command}\n" + CACHED_ARITHMETIC[command])
+            return
+        self.flush_stack_top()
+        if command in self._shared_comparisons:
+            label_return = f"{command.upper()}_RETURN_{self._next_label_id()}"
+            self._write(
+                f"// {command}\n"
+                f"@{label_return}\n"
+                "D=A\n"
+                f"@${command.upper()}\n"
+                "0;JMP\n"
+                f"({label_return})\n"
+            )
+        else:
+            self._write_inline_arithmetic(command)
 
+    def _write_inline_arithmetic(self, command: str) -> None:
         if command in self._arithmetic_commands:
             if command == "add":
-                self._output_stream.write(
+                self._write(
                     "// add\n"
                     "@SP\n"
                     "AM=M-1\n"
@@ -97,7 +301,7 @@ class CodeWriter:
                     "M=M+D\n"
                 )
             elif command == "sub":
-                self._output_stream.write(
+                self._write(
                     "// sub\n"
                     "@SP\n"
                     "AM=M-1\n"
@@ -106,17 +310,17 @@ class CodeWriter:
                     "M=M-D\n"
                 )
             elif command == "neg":
-                self._output_stream.write(
+                self._write(
                     "// neg\n"
                     "@SP\n"
                     "A=M-1\n"
                     "M=-M\n"
                 )
             elif command == "eq":
-                label_true = f"EQ_TRUE_{self._label_counter}"
-                label_end = f"EQ_END_{self._label_counter}"
-                self._label_counter += 1
-                self._output_stream.write(
+                label_id = self._next_label_id()
+                label_true = f"EQ_TRUE_{label_id}"
+                label_end = f"EQ_END_{label_id}"
+                self._write(
                     f"// eq\n"
                     "@SP\n"
                     "AM=M-1\n"
@@ -137,13 +341,13 @@ class CodeWriter:
                     f"({label_end})\n"
                 )
             elif command == "gt":
-                label_x_poz = f"X_POZ_{self._label_counter}"
-                label_end = f"END_{self._label_counter}"
-                label_false = f"FALSE_{self._label_counter}"
-                label_true = f"TRUE_{self._label_counter}"
-                label_same_sign = f"SAME_SIGN{self._label_counter}"
-                self._label_counter += 1
-                self._output_stream.write(
+                label_id = self._next_label_id()
+                label_x_poz = f"X_POZ_{label_id}"
+                label_end = f"END_{label_id}"
+                label_false = f"FALSE_{label_id}"
+                label_true = f"TRUE_{label_id}"
+                label_same_sign = f"SAME_SIGN{label_id}"
+                self._write(
                     f"// gt\n"
                     "@SP\n"
                     "AM=M-1\n"
@@ -157,7 +361,7 @@ class CodeWriter:
                     "M=D\n"
                     "D=M\n"
                     f"@{label_x_poz}\n"
-                    "D;JGT\n"
+                    "D;JGE\n"
                     "@R13\n"
                     "D=M\n"
                     f"@{label_false}\n"
@@ -189,13 +393,13 @@ class CodeWriter:
                     f"({label_end})\n"
                 )
             elif command == "lt":
-                label_x_poz = f"X_POZ_{self._label_counter}"
-                label_end = f"END_{self._label_counter}"
-                label_false = f"FALSE_{self._label_counter}"
-                label_true = f"TRUE_{self._label_counter}"
-                label_same_sign = f"SAME_SIGN{self._label_counter}"
-                self._label_counter += 1
-                self._output_stream.write(
+                label_id = self._next_label_id()
+                label_x_poz = f"X_POZ_{label_id}"
+                label_end = f"END_{label_id}"
+                label_false = f"FALSE_{label_id}"
+                label_true = f"TRUE_{label_id}"
+                label_same_sign = f"SAME_SIGN{label_id}"
+                self._write(
                     f"// lt\n"
                     "@SP\n"
                     "AM=M-1\n"
@@ -209,11 +413,11 @@ class CodeWriter:
                     "M=D\n"
                     "D=M\n"
                     f"@{label_x_poz}\n"
-                    "D;JGT\n"
+                    "D;JGE\n"
                     "@R14\n"
                     "D=M\n"
                     f"@{label_true}\n"
-                    "D;JGT\n"
+                    "D;JGE\n"
                     f"@{label_same_sign}\n"
                     "0;JMP\n"
                     f"({label_x_poz})\n"
@@ -241,7 +445,7 @@ class CodeWriter:
                     f"({label_end})\n"
                 )
             elif command == "and":
-                self._output_stream.write(
+                self._write(
                     "// and\n"
                     "@SP\n"
                     "AM=M-1\n"
@@ -250,7 +454,7 @@ class CodeWriter:
                     "M=D&M\n"
                 )
             elif command == "or":
-                self._output_stream.write(
+                self._write(
                     "// or\n"
                     "@SP\n"
                     "AM=M-1\n"
@@ -259,21 +463,21 @@ class CodeWriter:
                     "M=D|M\n"
                 )
             elif command == "not":
-                self._output_stream.write(
+                self._write(
                     "// not\n"
                     "@SP\n"
                     "A=M-1\n"
                     "M=!M\n"
                 )
             elif command == "shiftleft":
-                self._output_stream.write(
+                self._write(
                     "// shiftleft\n"
                     "@SP\n"
                     "A=M-1\n"
                     "M=M<<\n"
                 )
             elif command == "shiftright":
-                self._output_stream.write(
+                self._write(
                     "// shiftright\n"
                     "@SP\n"
                     "A=M-1\n"
@@ -294,23 +498,42 @@ class CodeWriter:
         # be translated to the assembly symbol "Xxx.i". In the subsequent
         # assembly process, the Hack assembler will allocate these symbolic
         # variables to the RAM, starting at address 16.
+        if self._cache_stack_top:
+            if command == "C_PUSH":
+                self.flush_stack_top()
+                self._write(
+                    f"// C_PUSH {segment}\n" + self._load_d(segment, index))
+                self._top_in_d = True
+                return
+            target = self._segment_address(segment, index)
+            if self._top_in_d and target is not None:
+                self._write(
+                    f"// C_POP {segment}\n" + target + "M=D\n")
+                self._top_in_d = False
+                return
+        self.flush_stack_top()
+        self._write_template((command, segment, index),
+                             self._push_pop_assembly, command, segment, index)
+
+    def _push_pop_assembly(self, command: str, segment: str,
+                           index: int) -> str:
+        # The translation of a push or pop that uses the stack in RAM.
         segment_pointer_segments = {
             "local", "argument", "this", "that"
         }
 
         if command == "C_PUSH":
             if segment == "constant":
-                self._output_stream.write(
+                return (
                     "// C_PUSH constant\n"
-                    f"@{index}\n"
-                    "D=A\n"
+                    + self._load_d(segment, index) +
                     "@SP\n"
                     "AM=M+1\n"
                     "A=A-1\n"
                     "M=D\n"
                 )
             elif segment in segment_pointer_segments:
-                self._output_stream.write(
+                return (
                     f"// C_PUSH {segment}\n"
                     f"@{self._segment_pointers[segment]}\n"
                     "D=M\n"
@@ -323,7 +546,7 @@ class CodeWriter:
                     "M=D\n"
                 )
             elif segment == "temp":
-                self._output_stream.write(
+                return (
                     f"// C_PUSH temp\n"
                     f"@{self._temp_segment_base_address + index}\n"
                     "D=M\n"
@@ -333,7 +556,7 @@ class CodeWriter:
                     "M=D\n"
                 )
             elif segment == "static":
-                self._output_stream.write(
+                return (
                     f"// C_PUSH static\n"
                     f"@{self._current_file_name}.{index}\n"
                     "D=M\n"
@@ -344,7 +567,7 @@ class CodeWriter:
                 )
             elif segment == "pointer":
                 address = "THIS" if index == 0 else "THAT"
-                self._output_stream.write(
+                return (
                     f"// C_PUSH pointer {index}\n"
                     f"@{address}\n"
                     "D=M\n"
@@ -355,7 +578,7 @@ class CodeWriter:
 
         elif command == "C_POP":
             if segment in segment_pointer_segments:
-                self._output_stream.write(
+                return (
                     f"// C_POP {segment}\n"
                     f"@{self._segment_pointers[segment]}\n"
                     "D=M\n"
@@ -371,7 +594,7 @@ class CodeWriter:
                     "M=D\n"
                 )
             elif segment == "temp":
-                self._output_stream.write(
+                return (
                     f"// C_POP temp\n"
                     "@SP\n"
                     "AM=M-1\n"
@@ -380,7 +603,7 @@ class CodeWriter:
                     "M=D\n"
                 )
             elif segment == "static":
-                self._output_stream.write(
+                return (
                     f"// C_POP static\n"
                     "@SP\n"
                     "AM=M-1\n"
@@ -390,7 +613,7 @@ class CodeWriter:
                 )
             elif segment == "pointer":
                 address = "THIS" if index == 0 else "THAT"
-                self._output_stream.write(
+                return (
                     f"// C_POP pointer {index}\n"
                     "@SP\n"
                     "AM=M-1\n"
@@ -398,7 +621,113 @@ class CodeWriter:
                     f"@{address}\n"
                     "M=D\n"
                 )
+        return ""
+
+    def write_move(self, source_segment: str, source_index: int,
+                   target_segment: str, target_index: int) -> None:
+        """Writes assembly code that is the translation of
+        "push source_segment source_index" immediately followed by
+        "pop target_segment target_index", copying the value directly
+        without going through the stack.
+
+        Args:
+            source_segment (str): the memory segment to read.
+            source_index (int): the index in the source segment.
+            target_segment (str): the memory segment to write.
+            target_index (int): the index in the target segment.
+        """
+        self.flush_stack_top()
+        self._write(
+            f"// move {source_segment} {source_index} "
+            f"{target_segment} {target_index}\n")
+        target = self._segment_address(target_segment, target_index)
+        if target is None:
+            self._write(
+                self._segment_address_to_r13(target_segment, target_index)
+                + self._load_d(source_segment, source_index)
+                + "@R13\n"
+                "A=M\n"
+                "M=D\n")
+        elif source_segment == "constant" and source_index in (-1, 0, 1):
+            self._write(target + f"M={source_index}\n")
+        else:
+            self._write(
+                self._load_d(source_segment, source_index)
+                + target + "M=D\n")
 
+    def write_store(self, segment: str, index: int) -> None:
+        """Writes assembly code that is the translation of
+        "pop segment index" immediately followed by "push segment index":
+        the stack top is copied to the segment, and stays on the stack.
+
+        Args:
+            segment (str): the memory segment to write.
+            index (int): the index in the segment.
+        """
+        self._write(f"// store {segment} {index}\n")
+        target = self._segment_address(segment, index)
+        if self._top_in_d and target is not None:
+            self._write(target + "M=D\n")
+            return
+        self.flush_stack_top()
+        if target is None:
+            self._write(
+                self._segment_address_to_r13(segment, index)
+                + "@SP\n"
+                "A=M-1\n"
+                "D=M\n"
+                "@R13\n"
+                "A=M\n"
+                "M=D\n")
+        else:
+            self._write(
+                "@SP\n"
+                "A=M-1\n"
+                "D=M\n"
+                + target + "M=D\n")
+
+    def _segment_address(self, segment: str,
+                         index: int) -> typing.Optional[str]:
+        # Assembly that points A at the segment entry without using D, or
+        # None if that would take too many instructions.
+        if segment == "temp":
+            return f"@{self._temp_segment_base_address + index}\n"
+        if segment == "static":
+            return f"@{self._current_file_name}.{index}\n"
+        if segment == "pointer":
+            return "@THIS\n" if index == 0 else "@THAT\n"
+        if index > MAX_STEPPED_OFFSET:
+            return None
+        address = f"@{self._segment_pointers[segment]}\n"
+        if index == 0:
+            return address + "A=M\n"
+        return address + "A=M+1\n" + "A=A+1\n" * (index - 1)
+
+    def _segment_address_to_r13(self, segment: str, index: int) -> str:
+        return (f"@{self._segment_pointers[segment]}\n"
+                "D=M\n"
+                f"@{index}\n"
+                "D=D+A\n"
+                "@R13\n"
+                "M=D\n")
+
+    def _load_d(self, segment: str, index: int) -> str:
+        # Assembly that loads the value of the segment entry into D. A
+        # constant may be any signed 16-bit number.
+        if segment == "constant":
+            if index in (-1, 0, 1):
+                return f"D={index}\n"
+            if index < 0:
+                return f"@{~index}\nD=!A\n"
+            return f"@{index}\nD=A\n"
+        address = self._segment_address(segment, index)
+        if address is None:
+            return (f"@{self._segment_pointers[segment]}\n"
+                    "D=M\n"
+                    f"@{index}\n"
+                    "A=D+A\n"
+                    "D=M\n")
+        return address + "D=M\n"
 
     def write_label(self, label: str) -> None:
         """Writes assembly code that affects the label command. 
@@ -413,7 +742,8 @@ class CodeWriter:
         """
         # This is irrelevant for project 7,
         # you will implement this in project 8!
-        self._output_stream.write(
+        self.flush_stack_top()
+        self._write(
             "// write_label\n"
             f"({self._current_func}${label})\n"
         )
@@ -427,7 +757,8 @@ class CodeWriter:
         """
         # This is irrelevant for project 7,
         # you will implement this in project 8!
-        self._output_stream.write(
+        self.flush_stack_top()
+        self._write(
             "// write_goto\n"
             f"@{self._current_func}${label}\n"
             "0;JMP\n"
@@ -442,7 +773,15 @@ class CodeWriter:
         """
         # This is irrelevant for project 7,
         # you will implement this in project 8!
-        self._output_stream.write(
+        if self._top_in_d:
+            self._write(
+                "// write_if_goto\n"
+                f"@{self._current_func}${label}\n"
+                "D;JNE\n"
+            )
+            self._top_in_d = False
+            return
+        self._write(
             "// write_if_goto\n"
             "@SP\n"
             "AM=M-1\n"
@@ -452,6 +791,72 @@ class CodeWriter:
         )
 
 
+    def write_compare_if(self, comparison: str, label: str) -> None:
+        """Writes assembly code that is the translation of a comparison
+        followed by "if-goto label", without computing a boolean: it jumps
+        to the label if the comparison between the two values on the top of
+        the stack is true, and pops them either way. Like write_arithmetic,
+        it compares correctly even where subtracting the values overflows.
+
+        Args:
+            comparison (str): one of "eq", "ne", "gt", "ge", "lt" or "le".
+            label (str): the label to go to.
+        """
+        target = f"{self._current_func}${label}"
+        jump = "J" + comparison.upper()
+        self._write(f"// {comparison} if-goto {label}\n")
+        if not self._top_in_d:
+            self._write(
+                "@SP\n"
+                "AM=M-1\n"
+                "D=M\n")
+        self._top_in_d = False
+        if comparison in {"eq", "ne"}:
+            self._write(
+                "@SP\n"
+                "AM=M-1\n"
+                "D=M-D\n"
+                f"@{target}\n"
+                f"D;{jump}\n")
+            return
+
+        # When only one of x and y is negative, x - y may overflow, but the
+        # negative one is the smaller one.
+        label_id = self._next_label_id()
+        label_x_neg = f"X_NEG_{label_id}"
+        label_same_sign = f"SAME_SIGN{label_id}"
+        label_end = f"END_{label_id}"
+        x_greater = target if comparison in {"gt", "ge"} else label_end
+        x_smaller = target if comparison in {"lt", "le"} else label_end
+        self._write(
+            "@R13\n"
+            "M=D\n"
+            "@SP\n"
+            "AM=M-1\n"
+            "D=M\n"
+            f"@{label_x_neg}\n"
+            "D;JLT\n"
+            "@R13\n"
+            "D=M\n"
+            f"@{x_greater}\n"
+            "D;JLT\n"
+            f"@{label_same_sign}\n"
+            "0;JMP\n"
+            f"({label_x_neg})\n"
+            "@R13\n"
+            "D=M\n"
+            f"@{x_smaller}\n"
+            "D;JGE\n"
+            f"({label_same_sign})\n"
+            "@SP\n"
+            "A=M\n"
+            "D=M\n"
+            "@R13\n"
+            "D=D-M\n"
+            f"@{target}\n"
+            f"D;{jump}\n"
+            f"({label_end})\n")
+
     def write_function(self, function_name: str, n_vars: int) -> None:
         """Writes assembly code that affects the function command. 
         The handling of each "function Xxx.foo" command within the file Xxx.vm
@@ -470,10 +875,9 @@ class CodeWriter:
         # (function_name)       // injects a function entry label into the code
         # repeat n_vars times:  // n_vars = number of local variables
         #   push constant 0     // initializes the local variables to 0
+        self.flush_stack_top()
         self._current_func = function_name
 
-        self._output_stream.write(f"// function {function_name} {n_vars}\n")
-        self._output_stream.write(f"({function_name})\n")
         push_zero_assembly = (
             "@SP\n"
             "A=M\n"
@@ -481,7 +885,10 @@ class CodeWriter:
             "@SP\n"
             "M=M+1\n"
         )
-        self._output_stream.write(push_zero_assembly * n_vars)
+        self._write(
+            f"// function {function_name} {n_vars}\n"
+            f"({function_name})\n"
+            + push_zero_assembly * n_vars)
 
 
     def write_call(self, function_name: str, n_args: int) -> None:
@@ -512,19 +919,50 @@ class CodeWriter:
         # LCL = SP              // repositions LCL
         # goto function_name    // transfers control to the callee
         # (return_address)      // injects the return address label into the code
-        return_label = f"{self._current_func}$ret.{self._label_counter}"
-        self._label_counter += 1
+        self.flush_stack_top()
+        return_label = f"{self._current_func}$ret.{self._next_label_id()}"
+
+        if self._shared_calls:
+            self._write(
+                f"@{function_name}\n"
+                "D=A\n"
+                "@R13\n"
+                "M=D\n"
+                f"@{n_args}\n"
+                "D=A\n"
+                "@R14\n"
+                "M=D\n"
+                f"@{return_label}\n"
+                "D=A\n"
+                "@$CALL\n"
+                "0;JMP\n"
+                f"({return_label})\n")
+            return
 
-        self._output_stream.write(
+        self._write(
             f"@{return_label}\n"
-            "D=A\n"
+            "D=A\n")
+        self._write_frame(n_args)
+        self._write(
+            f"@{function_name}\n"
+            "0;JMP\n"
+            f"({return_label})\n")
+
+    def _write_frame(self, n_args: typing.Optional[int]) -> None:
+        # Pushes D as the return address and the caller's segment pointers,
+        # and sets ARG and LCL for the callee. If n_args is None, it is
+        # read from R14.
+        self._write_template(("frame", n_args), self._frame_assembly, n_args)
+
+    def _frame_assembly(self, n_args: typing.Optional[int]) -> str:
+        assembly = [
             "@SP\n"
             "AM=M+1\n"
             "A=A-1\n"
-            "M=D\n")
+            "M=D\n"]
 
         for segment in ["LCL", "ARG", "THIS", "THAT"]:
-            self._output_stream.write(
+            assembly.append(
                 f"@{segment}\n"
                 "D=M\n"
                 "@SP\n"
@@ -532,30 +970,45 @@ class CodeWriter:
                 "A=A-1\n"
                 "M=D\n")
 
-        num_to_subtract = 5 + n_args
-        self._output_stream.write(
-            f"@{num_to_subtract}\n"
-            "D=A\n"
+        if n_args is None:
+            assembly.append(
+                "@R14\n"
+                "D=M\n"
+                "@5\n"
+                "D=D+A\n")
+        else:
+            num_to_subtract = 5 + n_args
+            assembly.append(
+                f"@{num_to_subtract}\n"
+                "D=A\n")
+        assembly.append(
             "@SP\n"
             "D=M-D\n"
             "@ARG\n"
             "M=D\n")
 
-        self._output_stream.write(
+        assembly.append(
             "@SP\n"
             "D=M\n"
             "@LCL\n"
             "M=D\n")
-
-        self._output_stream.write(
-            f"@{function_name}\n"
-            "0;JMP\n")
-
-        self._output_stream.write(f"({return_label})\n")
+        return "".join(assembly)
 
 
     def write_return(self) -> None:
         """Writes assembly code that affects the return command."""
+        self.flush_stack_top()
+        if self._shared_calls:
+            self._write(
+                "@$RETURN\n"
+                "0;JMP\n")
+        else:
+            self._write_inline_return()
+
+    def _write_inline_return(self) -> None:
+        self._write_template(("return",), self._inline_return_assembly)
+
+    def _inline_return_assembly(self) -> str:
         # This is irrelevant for project 7,
         # you will implement this in project 8!
         # The pseudo-code of "return" is:
@@ -570,14 +1023,14 @@ class CodeWriter:
         # goto return_address           // go to the return address
 
         # FRAME = LCL
-        self._output_stream.write(
+        assembly = [
             "@LCL\n"
             "D=M\n"
             "@R13\n"
-            "M=D\n")
+            "M=D\n"]
 
         # RET = *(FRAME-5)
-        self._output_stream.write(
+        assembly.append(
             "@5\n"
             "A=D-A\n"
             "D=M\n"
@@ -585,7 +1038,7 @@ class CodeWriter:
             "M=D\n")
 
         # *ARG = pop()
-        self._output_stream.write(
+        assembly.append(
             "@SP\n"
             "AM=M-1\n"
             "D=M\n"
@@ -594,7 +1047,7 @@ class CodeWriter:
             "M=D\n")
 
         # SP = ARG + 1
-        self._output_stream.write(
+        assembly.append(
             "@ARG\n"
             "D=M+1\n"
             "@SP\n"
@@ -605,7 +1058,7 @@ class CodeWriter:
         # LCL  = *(FRAME-4)
         i = 1
         for segment in ["THAT", "THIS", "ARG", "LCL"]:
-            self._output_stream.write(
+            assembly.append(
                 "@R13\n"
                 "D=M\n"
                 f"@{i}\n"
@@ -615,7 +1068,8 @@ class CodeWriter:
                 "M=D\n")
             i+=1
 
-        self._output_stream.write(
+        assembly.append(
             "@R14\n"
             "A=M\n"
             "0;JMP\n")
+        return "".join(assembly)
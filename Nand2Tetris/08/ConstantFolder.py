@@ -0,0 +1,119 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from VMOptimizer import VMCommand
+
+
+def _to_word(value: int) -> int:
+    # Wraps value to 16 bits, as a signed number.
+    return (value + 0x8000) % 0x10000 - 0x8000
+
+
+def _boolean(value: bool) -> int:
+    return -1 if value else 0
+
+
+UNARY_OPERATIONS: typing.Dict[str, typing.Callable[[int], int]] = {
+    "neg": lambda x: -x,
+    "not": lambda x: ~x,
+    "shiftleft": lambda x: x << 1,
+    # The Hack shifter inserts the sign bit on the left.
+    "shiftright": lambda x: x >> 1
+}
+
+BINARY_OPERATIONS: typing.Dict[str, typing.Callable[[int, int], int]] = {
+    "add": lambda x, y: x + y,
+    "sub": lambda x, y: x - y,
+    "and": lambda x, y: x & y,
+    "or": lambda x, y: x | y,
+    "eq": lambda x, y: _boolean(x == y),
+    "gt": lambda x, y: _boolean(x > y),
+    "lt": lambda x, y: _boolean(x < y)
+}
+
+# "push constant c; command" pairs that leave any stack as it is.
+IDENTITIES = {(0, "add"), (0, "sub"), (0, "or"), (-1, "and")}
+
+# Commands that undo themselves.
+INVOLUTIONS = {"not", "neg"}
+
+
+class ConstantFolder:
+    """Evaluates the arithmetic on constants while translating, rather than
+    at run time.
+
+    It rewrites, wherever they appear in a straight run of commands:
+
+    - an arithmetic command whose operands are all pushed constants into a
+      single push of the result, computed with 16-bit wraparound;
+    - "push constant 0; add", "push constant 0; sub", "push constant 0;
+      or" and "push constant -1; and" into nothing, and the same with the
+      constant pushed before the other operand of add, or and and;
+    - "not; not" and "neg; neg" into nothing.
+
+    Since a folded constant may be negative or above 32767, the constants
+    it pushes are any signed 16-bit number, which CodeWriter loads with
+    the cheapest instructions.
+    """
+
+    @staticmethod
+    def fold(commands: typing.Iterable[VMCommand]
+             ) -> typing.List[VMCommand]:
+        """Folds the given commands.
+
+        Args:
+            commands (typing.Iterable[VMCommand]): the parsed commands.
+
+        Returns:
+            typing.List[VMCommand]: the folded commands, in order.
+        """
+        output: typing.List[VMCommand] = []
+        for command in commands:
+            output.append(command)
+            while ConstantFolder._fold_tail(output):
+                pass
+        return output
+
+    @staticmethod
+    def _fold_tail(output: typing.List[VMCommand]) -> bool:
+        # Rewrites the last commands of output once, if it can.
+        if len(output) < 2 or output[-1][0] != "C_ARITHMETIC":
+            return False
+        operation = output[-1][1]
+        operand = _constant(output[-2])
+        if operation in INVOLUTIONS and output[-2] == output[-1]:
+            del output[-2:]
+            return True
+        if operation in UNARY_OPERATIONS and operand is not None:
+            output[-2:] = [("C_PUSH", "constant", _to_word(
+                UNARY_OPERATIONS[operation](operand)))]
+            return True
+        if operation not in BINARY_OPERATIONS:
+            return False
+        if (operand, operation) in IDENTITIES:
+            del output[-2:]
+            return True
+        if len(output) < 3:
+            return False
+        first = _constant(output[-3])
+        if first is not None and operand is not None:
+            output[-3:] = [("C_PUSH", "constant", _to_word(
+                BINARY_OPERATIONS[operation](first, operand)))]
+            return True
+        if ((first, operation) in IDENTITIES and operation != "sub"
+                and output[-2][0] == "C_PUSH"):
+            output[-3:] = [output[-2]]
+            return True
+        return False
+
+
+def _constant(command: VMCommand) -> typing.Optional[int]:
+    # The value of a pushed constant, as a signed number.
+    if command[:2] == ("C_PUSH", "constant"):
+        return _to_word(command[2])
+    return None
@@ -0,0 +1,216 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from CallGraph import CallGraph, Program
+from VMOptimizer import VMCommand
+
+
+# "Translate the following commands as part of the given file", so that
+# the static segment of an inlined function still refers to its own file:
+# ("C_FILE", file name).
+C_FILE = "C_FILE"
+
+TEMP_SEGMENT_SIZE = 8
+
+# Arithmetic commands that pop two values, rather than one, before pushing.
+BINARY_COMMANDS = {"add", "sub", "eq", "gt", "lt", "and", "or"}
+
+
+class _Callee:
+    """A leaf function that can be inlined."""
+
+    def __init__(self, file_name: str, name: str, n_vars: int,
+                 body: typing.List[VMCommand]) -> None:
+        self.file_name = file_name
+        self.name = name
+        self.n_vars = n_vars
+        self.body = body
+        self.temps = _temps_used(body)
+        self.pointers = sorted({command[2] for command in body
+                                if command[:2] == ("C_POP", "pointer")})
+        self.n_arguments = 1 + max(_indices(body, "argument"), default=-1)
+
+    def fits_frame(self) -> bool:
+        # Whether it only uses the local variables it declares.
+        return all(index < self.n_vars
+                   for index in _indices(self.body, "local"))
+
+
+class Inliner:
+    """Replaces calls to small leaf functions with the functions' bodies.
+
+    A leaf function calls no other function. It is inlined if its body has
+    at most max_size commands, and if every return leaves exactly the
+    return value on its stack, which is checked by tracking the stack depth
+    through its jumps.
+
+    The arguments and local variables of the inlined function move to temp
+    entries that neither the caller nor the callee use, and the pointer
+    entries it sets are saved in temp entries and restored afterwards, since
+    a real return would restore them. A call is left as it is if there are
+    not enough free temp entries. The labels of the inlined function are
+    renamed so that they are unique in the caller.
+    """
+
+    @staticmethod
+    def inline(program: Program, max_size: int
+               ) -> typing.Tuple[Program, int]:
+        """Inlines the calls to the small leaf functions of a program. The
+        functions themselves are kept, see CallGraph.remove_dead_functions.
+
+        Args:
+            program (Program): the parsed files of the program.
+            max_size (int): the largest number of commands, not counting the
+                "function" command, that a function to inline may have.
+
+        Returns:
+            typing.Tuple[Program, int]: the program with the calls inlined,
+            and the number of inlined calls.
+        """
+        call_graph = CallGraph(program)
+        callees = {}
+        for file_name, commands in program:
+            for command in commands:
+                if command[0] != "C_FUNCTION":
+                    continue
+                body = call_graph.functions[command[1]][1:]
+                if (call_graph.callees[command[1]] or len(body) > max_size
+                        or not Inliner._returns_one_value(body)):
+                    continue
+                callee = _Callee(file_name, command[1], command[2], body)
+                if callee.fits_frame():
+                    callees[command[1]] = callee
+
+        result = []
+        inlined = 0
+        for file_name, commands in program:
+            output: typing.List[VMCommand] = []
+            caller_temps = set()
+            for command in commands:
+                if command[0] == "C_FUNCTION":
+                    caller_temps = _temps_used(
+                        call_graph.functions[command[1]])
+                callee = callees.get(command[1]) if command[0] == "C_CALL" \
+                    else None
+                if callee is None or not Inliner._expand(
+                        callee, command[2], file_name, caller_temps,
+                        inlined, output):
+                    output.append(command)
+                    continue
+                inlined += 1
+            result.append((file_name, output))
+        return result, inlined
+
+    @staticmethod
+    def _returns_one_value(body: typing.List[VMCommand]) -> bool:
+        # Tracks the depth of the function's own stack. It is None after an
+        # unconditional jump, until a label with a known depth.
+        depth: typing.Optional[int] = 0
+        label_depths: typing.Dict[str, int] = {}
+
+        def jump_to(label: str, current: int) -> bool:
+            return label_depths.setdefault(label, current) == current
+
+        for command in body:
+            command_type = command[0]
+            if depth is None:
+                if command_type != "C_LABEL" or command[1] not in \
+                        label_depths:
+                    return False
+                depth = label_depths[command[1]]
+            if command_type == "C_PUSH":
+                depth += 1
+            elif command_type == "C_POP":
+                depth -= 1
+            elif command_type == "C_ARITHMETIC":
+                depth -= 1 if command[1] in BINARY_COMMANDS else 0
+            elif command_type == "C_LABEL":
+                if not jump_to(command[1], depth):
+                    return False
+            elif command_type == "C_GOTO":
+                if not jump_to(command[1], depth):
+                    return False
+                depth = None
+            elif command_type == "C_IF":
+                depth -= 1
+                if depth < 0 or not jump_to(command[1], depth):
+                    return False
+            elif command_type == "C_RETURN":
+                if depth != 1:
+                    return False
+                depth = None
+            else:
+                return False
+            if depth is not None and depth < 0:
+                return False
+        return depth is None
+
+    @staticmethod
+    def _expand(callee: _Callee, n_args: int, caller_file: str,
+                caller_temps: typing.Set[int], count: int,
+                output: typing.List[VMCommand]) -> bool:
+        # Appends the inlined call to output, if there are enough free temp
+        # entries and the callee only uses the arguments it is given.
+        if callee.n_arguments > n_args:
+            return False
+        free = [index for index in range(TEMP_SEGMENT_SIZE)
+                if index not in caller_temps and index not in callee.temps]
+        if len(free) < n_args + callee.n_vars + len(callee.pointers):
+            return False
+        arguments = free[:n_args]
+        local_vars = free[n_args:n_args + callee.n_vars]
+        saved_pointers = free[n_args + callee.n_vars:]
+        segments = {"argument": arguments, "local": local_vars}
+
+        for index in reversed(arguments):
+            output.append(("C_POP", "temp", index))
+        for index in local_vars:
+            output.append(("C_PUSH", "constant", 0))
+            output.append(("C_POP", "temp", index))
+        for pointer, index in zip(callee.pointers, saved_pointers):
+            output.append(("C_PUSH", "pointer", pointer))
+            output.append(("C_POP", "temp", index))
+        if callee.file_name != caller_file:
+            output.append((C_FILE, callee.file_name))
+
+        prefix = f"{callee.name}.{count}."
+        end_label = f"{prefix}RETURN"
+        jumps_to_end = False
+        for position, command in enumerate(callee.body):
+            command_type = command[0]
+            if command_type in {"C_PUSH", "C_POP"} and command[1] in segments:
+                output.append((command_type, "temp",
+                               segments[command[1]][command[2]]))
+            elif command_type in {"C_LABEL", "C_GOTO", "C_IF"}:
+                output.append((command_type, prefix + command[1]))
+            elif command_type == "C_RETURN":
+                if position + 1 < len(callee.body):
+                    output.append(("C_GOTO", end_label))
+                    jumps_to_end = True
+            else:
+                output.append(command)
+        if jumps_to_end:
+            output.append(("C_LABEL", end_label))
+
+        if callee.file_name != caller_file:
+            output.append((C_FILE, caller_file))
+        for pointer, index in zip(callee.pointers, saved_pointers):
+            output.append(("C_PUSH", "temp", index))
+            output.append(("C_POP", "pointer", pointer))
+        return True
+
+
+def _indices(commands: typing.Iterable[VMCommand],
+             segment: str) -> typing.Set[int]:
+    # The indices of the segment that the commands push or pop.
+    return {command[2] for command in commands
+            if command[0] in {"C_PUSH", "C_POP"} and command[1] == segment}
+
+
+def _temps_used(commands: typing.Iterable[VMCommand]) -> typing.Set[int]:
+    return _indices(commands, "temp")
@@ -5,83 +5,233 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import argparse
+import collections
+import concurrent.futures
+import functools
+import io
+import itertools
 import os
-import typing
 import sys
-from Parser import Parser
+import typing
+from Parser import Parser, COMMAND_TYPES, C_RETURN
 from CodeWriter import CodeWriter
+from CallGraph import CallGraph
+from ConstantFolder import ConstantFolder
+from Inliner import Inliner, C_FILE
+from VMOptimizer import (VMOptimizer, VMCommand, C_MOVE, C_STORE,
+                         C_COMPARE_IF)
 
 
-def translate_file(
-        input_file: typing.TextIO, output_file: typing.TextIO,
-        bootstrap: bool) -> None:
-    """Translates a single file.
+def parse_commands(parser: Parser) -> typing.Iterator[VMCommand]:
+    """Reads the commands of a parser as tuples.
 
     Args:
-        input_file (typing.TextIO): the file to translate.
-        output_file (typing.TextIO): writes all output to this file.
-        bootstrap (bool): if this is True, the current file is the 
+        parser (Parser): the parser to read.
+
+    Returns:
+        typing.Iterator[VMCommand]: the commands, in order.
+    """
+    for opcode, arg1, arg2 in parser.records():
+        if opcode == C_RETURN:
+            yield (COMMAND_TYPES[opcode],)
+        elif arg2 is None:
+            yield (COMMAND_TYPES[opcode], arg1)
+        else:
+            yield (COMMAND_TYPES[opcode], arg1, arg2)
+
+
+def read_program(input_paths: typing.Iterable[str]
+                 ) -> typing.List[typing.Tuple[str, typing.List[VMCommand]]]:
+    """Parses every .vm file of a program, so that whole-program decisions
+    can be made before translating.
+
+    Args:
+        input_paths (typing.Iterable[str]): the files; other than .vm files
+            are skipped.
+
+    Returns:
+        typing.List[typing.Tuple[str, typing.List[VMCommand]]]: the name
+        and commands of every file, in order.
+    """
+    program = []
+    for input_path in input_paths:
+        filename, extension = os.path.splitext(input_path)
+        if extension.lower() != ".vm":
+            continue
+        with open(input_path, 'r') as input_file:
+            program.append((os.path.basename(filename),
+                            list(parse_commands(Parser(input_file)))))
+    return program
+
+
+def translate_commands(file_name: str, commands: typing.Iterable[VMCommand],
+                       bootstrap: bool) -> None:
+    """Translates the parsed commands of a single file.
+
+    Args:
+        file_name (str): the name of the file, without its extension.
+        commands (typing.Iterable[VMCommand]): the commands of the file.
+        bootstrap (bool): if this is True, the current file is the
             first file we are translating.
     """
-    # Your code goes here!
-    #code_writer = CodeWriter(output_file)
     if bootstrap:
         code_writer.write_init()
-    code_writer.set_file_name(os.path.splitext(
-        os.path.basename(input_file.name))[0])
-    
-    parser = Parser(input_file)
-    while parser.has_more_commands():
-        parser.advance()
-        command_type = parser.command_type()
-
-        if command_type == "C_ARITHMETIC":
-            code_writer.write_arithmetic(parser.arg1())
-        elif command_type in {"C_PUSH", "C_POP"}:
-            code_writer.write_push_pop(command_type, parser.arg1(), parser.arg2())
-        
-        elif command_type == "C_LABEL":
-            code_writer.write_label(parser.arg1())
-        elif command_type == "C_GOTO":
-            code_writer.write_goto(parser.arg1())
-        elif command_type == "C_IF":
-            code_writer.write_if(parser.arg1())
-        elif command_type == "C_FUNCTION":
-            code_writer.write_function(parser.arg1(), parser.arg2())
-        elif command_type == "C_CALL":
-            code_writer.write_call(parser.arg1(), parser.arg2())
-        elif command_type == "C_RETURN":
-            code_writer.write_return()
+        code_writer.write_prelude()
+    code_writer.set_file_name(file_name)
+
+    dispatch_table = {
+        "C_ARITHMETIC": code_writer.write_arithmetic,
+        "C_PUSH": functools.partial(code_writer.write_push_pop, "C_PUSH"),
+        "C_POP": functools.partial(code_writer.write_push_pop, "C_POP"),
+        "C_LABEL": code_writer.write_label,
+        "C_GOTO": code_writer.write_goto,
+        "C_IF": code_writer.write_if,
+        "C_FUNCTION": code_writer.write_function,
+        "C_CALL": code_writer.write_call,
+        "C_RETURN": code_writer.write_return,
+        C_MOVE: code_writer.write_move,
+        C_STORE: code_writer.write_store,
+        C_COMPARE_IF: code_writer.write_compare_if,
+        C_FILE: code_writer.set_file_name
+    }
+    for command_type, *args in commands:
+        dispatch_table[command_type](*args)
+    code_writer.flush_stack_top()
+    code_writer.flush()
+
 
+def translate_fragment(file_name: str, commands: typing.List[VMCommand],
+                       writer_options: typing.Tuple[typing.Any, ...]) -> str:
+    """Translates the parsed commands of a single file on their own, with
+    labels in a namespace of the file. This is the unit of work of the
+    --jobs process pool.
+
+    Args:
+        file_name (str): the name of the file, without its extension.
+        commands (typing.List[VMCommand]): the commands of the file.
+        writer_options (typing.Tuple[typing.Any, ...]): the arguments of
+            CodeWriter after its output stream.
+
+    Returns:
+        str: the assembly code of the file.
+    """
+    global code_writer
+    output = io.StringIO()
+    code_writer = CodeWriter(output, *writer_options,
+                             label_namespace=f"{file_name}.")
+    translate_commands(file_name, commands, False)
+    return output.getvalue()
 
 
 if "__main__" == __name__:
-    # Parses the input path and calls translate_file on each input file.
+    # Parses the input path and calls translate_commands on each input file.
     # This opens both the input and the output files!
     # Both are closed automatically when the code finishes running.
     # If the output file does not exist, it is created automatically in the
     # correct path, using the correct filename.
-    if not len(sys.argv) == 2:
-        sys.exit("Invalid usage, please use: VMtranslator <input path>")
-    argument_path = os.path.abspath(sys.argv[1])
+    argument_parser = argparse.ArgumentParser(
+        prog="VMtranslator",
+        description="Translates VM code to Hack assembly.")
+    argument_parser.add_argument(
+        "input_path", help="a .vm file, or a directory of .vm files")
+    argument_parser.add_argument(
+        "--optimize", action="store_true",
+        help="combine push/pop pairs into direct moves before translating")
+    argument_parser.add_argument(
+        "--shared-comparisons", action="store_true",
+        help="translate eq, gt and lt to calls to routines shared by the "
+        "whole program, for every comparison where that takes less code")
+    argument_parser.add_argument(
+        "--shared-calls", action="store_true",
+        help="translate call and return to jumps to routines shared by the "
+        "whole program")
+    argument_parser.add_argument(
+        "--fold-constants", action="store_true",
+        help="evaluate arithmetic on constants, and drop arithmetic that "
+        "does nothing, before translating")
+    argument_parser.add_argument(
+        "--fuse-branches", action="store_true",
+        help="translate a comparison followed by if-goto to a conditional "
+        "jump, without computing a boolean")
+    argument_parser.add_argument(
+        "--cache-stack-top", action="store_true",
+        help="keep the stack top in D between commands that can use it "
+        "from there")
+    argument_parser.add_argument(
+        "--inline", type=int, default=0, metavar="SIZE",
+        help="inline the calls to functions that call no other function "
+        "and have at most SIZE commands (default: 0, no inlining)")
+    argument_parser.add_argument(
+        "--remove-dead-functions", action="store_true",
+        help="skip the functions that cannot be called from Sys.init, and "
+        "report them")
+    argument_parser.add_argument(
+        "--jobs", type=int, default=1, metavar="N",
+        help="translate every file on its own, with N worker processes (0: "
+        "one per CPU), and concatenate the results in file name order")
+    arguments = argument_parser.parse_args()
+    argument_path = os.path.abspath(arguments.input_path)
 
     if os.path.isdir(argument_path):
         files_to_translate = [
             os.path.join(argument_path, filename)
-            for filename in os.listdir(argument_path)]
+            for filename in sorted(os.listdir(argument_path))]
         output_path = os.path.join(argument_path, os.path.basename(
             argument_path))
     else:
         files_to_translate = [argument_path]
         output_path, extension = os.path.splitext(argument_path)
     output_path += ".asm"
-    bootstrap = True
-    with open(output_path, 'w') as output_file:
-        code_writer = CodeWriter(output_file)
-        for input_path in files_to_translate:
-            filename, extension = os.path.splitext(input_path)
-            if extension.lower() != ".vm":
-                continue
-            with open(input_path, 'r') as input_file:
-                translate_file(input_file, output_file, bootstrap)
-            bootstrap = False
+    program = read_program(files_to_translate)
+    if arguments.inline > 0:
+        program, inlined = Inliner.inline(program, arguments.inline)
+        print(f"inlined {inlined} calls", file=sys.stderr)
+    if arguments.remove_dead_functions:
+        program, report = CallGraph.remove_dead_functions(program)
+        print(report, file=sys.stderr)
+    if arguments.fold_constants:
+        program = [(file_name, ConstantFolder.fold(commands))
+                   for file_name, commands in program]
+    if arguments.optimize:
+        program = [(file_name, list(VMOptimizer.optimize(commands)))
+                   for file_name, commands in program]
+    if arguments.fuse_branches:
+        program = [(file_name, list(VMOptimizer.fuse_branches(commands)))
+                   for file_name, commands in program]
+    shared_comparisons = set()
+    if arguments.shared_comparisons:
+        shared_comparisons = CodeWriter.choose_shared_comparisons(
+            collections.Counter(
+                command[1] for _, commands in program
+                for command in commands if command[0] == "C_ARITHMETIC"))
+    writer_options = (shared_comparisons, arguments.shared_calls,
+                      arguments.cache_stack_top)
+    if arguments.jobs != 1:
+        jobs = arguments.jobs or os.cpu_count() or 1
+        file_names = [file_name for file_name, _ in program]
+        command_lists = [commands for _, commands in program]
+        if jobs > 1 and len(program) > 1:
+            with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+                # Results come back in submission order, so the output does
+                # not depend on which worker finished first.
+                fragments = list(executor.map(
+                    translate_fragment, file_names, command_lists,
+                    itertools.repeat(writer_options)))
+        else:
+            fragments = list(map(translate_fragment, file_names,
+                                 command_lists,
+                                 itertools.repeat(writer_options)))
+        with open(output_path, 'w') as output_file:
+            code_writer = CodeWriter(output_file, *writer_options)
+            code_writer.write_init()
+            code_writer.write_prelude()
+            code_writer.flush()
+            output_file.writelines(fragments)
+    else:
+        bootstrap = True
+        with open(output_path, 'w') as output_file:
+            code_writer = CodeWriter(output_file, *writer_options)
+            for file_name, commands in program:
+                translate_commands(file_name, commands, bootstrap)
+                bootstrap = False
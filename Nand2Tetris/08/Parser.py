@@ -5,9 +5,41 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import sys
 import typing
 
 
+# The opcodes of decoded commands, which index COMMAND_TYPES.
+(C_ARITHMETIC, C_PUSH, C_POP, C_LABEL, C_GOTO, C_IF, C_FUNCTION, C_RETURN,
+ C_CALL) = range(9)
+
+COMMAND_TYPES = ("C_ARITHMETIC", "C_PUSH", "C_POP", "C_LABEL", "C_GOTO",
+                 "C_IF", "C_FUNCTION", "C_RETURN", "C_CALL")
+
+ARITHMETIC_COMMANDS = ("add", "sub", "neg", "eq", "gt", "lt", "and", "or",
+                       "not", "shiftleft", "shiftright")
+
+OPCODES = {
+    **{command: C_ARITHMETIC for command in ARITHMETIC_COMMANDS},
+    "push": C_PUSH,
+    "pop": C_POP,
+    "label": C_LABEL,
+    "goto": C_GOTO,
+    "if-goto": C_IF,
+    "function": C_FUNCTION,
+    "return": C_RETURN,
+    "call": C_CALL
+}
+
+# Opcodes of the commands that have a second, numeric, argument.
+NUMERIC_OPCODES = frozenset((C_PUSH, C_POP, C_FUNCTION, C_CALL))
+
+# A decoded command: its opcode, its first argument (the command itself for
+# arithmetic commands, None for return) as an interned string, and its
+# second argument (None if it has none).
+VMRecord = typing.Tuple[int, typing.Optional[str], typing.Optional[int]]
+
+
 class Parser:
     """
     # Parser
@@ -47,24 +79,17 @@ class Parser:
     """
 
     def __init__(self, input_file: typing.TextIO) -> None:
-        """Gets ready to parse the input file.
+        """Gets ready to parse the input file. Every command is decoded
+        once, here, into a VMRecord.
 
         Args:
             input_file (typing.TextIO): input file.
         """
-        # Your code goes here!
-        # A good place to start is to read all the lines of the input:
-
-        input_lines = input_file.read().splitlines()
-        cleaned_lines = []
-        for line in input_lines:
-            line = self._remove_comments_and_whitespace(line)
-            if line:
-                cleaned_lines.append(line)
-        
-        self._commands = cleaned_lines
+        lines = (self._remove_comments_and_whitespace(line)
+                 for line in input_file.read().splitlines())
+        self._records = [self._decode(line) for line in lines if line]
         self._current_index = -1
-        self._current_command = None
+        self._current_record: typing.Optional[VMRecord] = None
 
     def _remove_comments_and_whitespace(self, line: str) -> str:
         if '//' in line:
@@ -72,13 +97,34 @@ class Parser:
 
         return ' '.join(line.strip().split())
 
+    def _decode(self, line: str) -> VMRecord:
+        parts = line.split()
+        opcode = OPCODES.get(parts[0])
+        if opcode is None:
+            raise ValueError(f"Unknown VM command: {line}")
+        if opcode == C_ARITHMETIC:
+            return (opcode, sys.intern(parts[0]), None)
+        if opcode == C_RETURN:
+            return (opcode, None, None)
+        if opcode in NUMERIC_OPCODES:
+            return (opcode, sys.intern(parts[1]), int(parts[2]))
+        return (opcode, sys.intern(parts[1]), None)
+
+    def records(self) -> typing.List[VMRecord]:
+        """
+        Returns:
+            typing.List[VMRecord]: all the decoded commands of the input, in
+            order, regardless of the current command.
+        """
+        return self._records
+
     def has_more_commands(self) -> bool:
         """Are there more commands in the input?
 
         Returns:
             bool: True if there are more commands, False otherwise.
         """
-        return len(self._commands) -1 > self._current_index
+        return len(self._records) - 1 > self._current_index
 
     def advance(self) -> None:
         """Reads the next command from the input and makes it the current 
@@ -86,8 +132,16 @@ class Parser:
         there is no current command.
         """
         if self.has_more_commands():
-            self._current_index+=1
-            self._current_command = self._commands[self._current_index]
+            self._current_index += 1
+            self._current_record = self._records[self._current_index]
+
+    def opcode(self) -> int:
+        """
+        Returns:
+            int: the opcode of the current VM command, which indexes
+            COMMAND_TYPES.
+        """
+        return self._current_record[0]
 
     def command_type(self) -> str:
         """
@@ -98,28 +152,7 @@ class Parser:
             "C_PUSH", "C_POP", "C_LABEL", "C_GOTO", "C_IF", "C_FUNCTION",
             "C_RETURN", "C_CALL".
         """
-        arithmetic_commands = ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not", "shiftleft", "shiftright"]
-        command = self._current_command.split()[0]
-        if command in arithmetic_commands:
-            return "C_ARITHMETIC"
-        elif command == "push":
-            return "C_PUSH"
-        elif command == "pop":
-            return "C_POP"
-        elif command == "label":
-            return "C_LABEL"
-        elif command == "goto":
-            return "C_GOTO"
-        elif command == "if-goto":
-            return "C_IF"
-        elif command == "function":
-            return "C_FUNCTION"
-        elif command == "return":
-            return "C_RETURN"
-        elif command == "call":
-            return "C_CALL"
-
-        
+        return COMMAND_TYPES[self._current_record[0]]
 
     def arg1(self) -> str:
         """
@@ -128,11 +161,7 @@ class Parser:
             "C_ARITHMETIC", the command itself (add, sub, etc.) is returned. 
             Should not be called if the current command is "C_RETURN".
         """
-        if self.command_type() == "C_ARITHMETIC":
-            return self._current_command.split()[0]
-        elif self.command_type() != "C_RETURN":
-            return self._current_command.split()[1]
-    
+        return self._current_record[1]
 
     def arg2(self) -> int:
         """
@@ -141,6 +170,4 @@ class Parser:
             called only if the current command is "C_PUSH", "C_POP", 
             "C_FUNCTION" or "C_CALL".
         """
-        # Your code goes here!
-        if self.command_type() in ["C_PUSH", "C_POP", "C_FUNCTION", "C_CALL"]:
-            return int(self._current_command.split()[2])
\ No newline at end of file
+        return self._current_record[2]
@@ -0,0 +1,118 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+
+
+# A VM command as a tuple: its type, as returned by Parser.command_type(),
+# followed by its arguments, e.g. ("C_PUSH", "local", 2) or ("C_RETURN",).
+VMCommand = typing.Tuple[typing.Any, ...]
+
+# "push <segment> <index>; pop <segment> <index>", as a single move:
+# ("C_MOVE", source segment, source index, target segment, target index).
+C_MOVE = "C_MOVE"
+
+# "pop <segment> <index>; push <segment> <index>", which stores the stack top
+# without popping it: ("C_STORE", segment, index).
+C_STORE = "C_STORE"
+
+# A comparison followed by "if-goto <label>", as a single conditional jump:
+# ("C_COMPARE_IF", comparison, label), where the comparison is one of
+# NEGATED_COMPARISONS.
+C_COMPARE_IF = "C_COMPARE_IF"
+
+# The comparison that is true exactly when the given one is false.
+NEGATED_COMPARISONS = {
+    "eq": "ne", "ne": "eq",
+    "gt": "le", "le": "gt",
+    "lt": "ge", "ge": "lt"
+}
+
+
+class VMOptimizer:
+    """A peephole optimizer over the VM commands of one file.
+
+    It looks at every pair of consecutive commands, and rewrites:
+
+    - "push x; pop x" into nothing;
+    - "push x; pop y" into a C_MOVE from x to y, which never touches the
+      stack;
+    - "pop x; push x" into a C_STORE to x, which leaves the stack as it is.
+
+    Since only adjacent commands are combined, no label can fall between
+    them, so control never enters the middle of a rewritten pair.
+    """
+
+    @staticmethod
+    def optimize(commands: typing.Iterable[VMCommand]
+                 ) -> typing.Iterator[VMCommand]:
+        """Optimizes the given commands lazily.
+
+        Args:
+            commands (typing.Iterable[VMCommand]): the parsed commands.
+
+        Returns:
+            typing.Iterator[VMCommand]: the optimized commands, in order.
+        """
+        pending = None
+        for command in commands:
+            if pending is not None:
+                combined = VMOptimizer._combine(pending, command)
+                if combined is not None:
+                    yield from combined
+                    pending = None
+                    continue
+                yield pending
+            pending = command
+        if pending is not None:
+            yield pending
+
+    @staticmethod
+    def fuse_branches(commands: typing.Iterable[VMCommand]
+                      ) -> typing.Iterator[VMCommand]:
+        """Rewrites "eq", "gt" or "lt", optionally followed by "not", and
+        then by "if-goto", into a single C_COMPARE_IF.
+
+        Args:
+            commands (typing.Iterable[VMCommand]): the parsed commands.
+
+        Returns:
+            typing.Iterator[VMCommand]: the rewritten commands, in order.
+        """
+        pending: typing.List[VMCommand] = []
+        for command in commands:
+            pending.append(command)
+            if command[0] == "C_IF" and len(pending) > 1:
+                condition = pending[-2]
+                negated = condition == ("C_ARITHMETIC", "not")
+                if negated and len(pending) > 2:
+                    condition = pending[-3]
+                if (condition[0] == "C_ARITHMETIC"
+                        and condition[1] in {"eq", "gt", "lt"}):
+                    comparison = condition[1]
+                    if negated:
+                        comparison = NEGATED_COMPARISONS[comparison]
+                    del pending[-3 if negated else -2:]
+                    pending.append((C_COMPARE_IF, comparison, command[1]))
+            # Only the last two commands can still become part of a fused
+            # branch.
+            while len(pending) > 2:
+                yield pending.pop(0)
+        yield from pending
+
+    @staticmethod
+    def _combine(first: VMCommand, second: VMCommand
+                 ) -> typing.Optional[typing.List[VMCommand]]:
+        # Returns what replaces the pair, or None to keep it.
+        if first[0] == "C_PUSH" and second[0] == "C_POP":
+            if first[1:] == second[1:]:
+                return []
+            return [(C_MOVE, first[1], first[2], second[1], second[2])]
+        if (first[0] == "C_POP" and second[0] == "C_PUSH"
+                and first[1:] == second[1:]):
+            return [(C_STORE, first[1], first[2])]
+        return None